@@ -0,0 +1,123 @@
+""" persistent store of concept lookups (UMLS, MeSH on Demand, MetaMap)
+
+Results of the external services are kept by source and normalized term,
+so a term looked up once (for any topic, topic set or target) is never
+fetched again:
+
+    - 'umls-search': UMLS search result of a term (UMLS_api.get_cuis)
+    - 'umls-atoms': atoms of a CUI (UMLS_api.get_atoms)
+    - 'mod-mesh': MeSH headings of a term (MOD_api.get_mesh)
+    - 'mm-mesh': preferred name of the first MetaMap concept of a phrase
+
+Raw service results are stored (not the query terms derived from them),
+so changes in the query builder do not invalidate the store. Failed
+lookups (None) are cached as well, with a separate ttl (negative_ttl) so
+that transient service errors are retried eventually.
+
+The store is a sqlite database; writes are atomic transactions, and any
+number of processes and threads may read and write it concurrently.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from config import config as cfg
+
+# stores of the current process; pid -> {path: store}
+_stores = dict()
+
+
+def normalize(term):
+    """case and whitespace insensitive key of a term"""
+    return ' '.join(term.lower().split())
+
+
+def store():
+    """concept store of the current process (PATHS['concepts'])"""
+    opened = _stores.setdefault(os.getpid(), dict())
+    path = cfg.PATHS['concepts']
+    if path not in opened:
+        opened[path] = ConceptStore(path, **cfg.CONF_CONCEPTS)
+    return opened[path]
+
+
+def lookup(source, term, fetch):
+    """read-through lookup in the concept store of the current process"""
+    return store().lookup(source, term, fetch)
+
+
+class ConceptStore(object):
+    def __init__(self, path, ttl=None, negative_ttl=None, timeout=60.):
+        """
+        :param path: sqlite database; created if not exists
+        :param ttl: seconds a result stays valid; forever if None
+        :param negative_ttl: seconds a failed lookup (None) stays valid;
+            ttl if None
+        :param timeout: seconds to wait for a lock held by another writer
+        """
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self.timeout = timeout
+        self._local = threading.local()  # a connection per thread
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS concepts ('
+                         'source TEXT, term TEXT, value TEXT, created REAL, '
+                         'PRIMARY KEY (source, term))')
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            # readers do not block the writer (and the other way around)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, source, term):
+        """cached result of a term
+
+        :return: (found, value); found is False for missing or expired
+            entries
+        """
+        row = self._conn().execute(
+            'SELECT value, created FROM concepts WHERE source=? AND term=?',
+            (source, normalize(term))).fetchone()
+        if row is None:
+            return False, None
+        value = json.loads(row[0])
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl is not None and time.time() - row[1] > ttl:
+            return False, None
+        return True, value
+
+    def put(self, source, term, value):
+        """store the result of a term (None for a failed lookup)"""
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO concepts VALUES (?, ?, ?, ?)',
+                         (source, normalize(term), json.dumps(value),
+                          time.time()))
+
+    def lookup(self, source, term, fetch):
+        """cached result of a term, or fetch(term) stored in the cache
+
+        :param fetch: function fetching the result of a term from the
+            service; exceptions are not cached
+        """
+        found, value = self.get(source, term)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = fetch(term)
+        self.put(source, term, value)
+        return value
@@ -0,0 +1,105 @@
+""" CUI enrichment of the imported articles
+
+MetaMap concepts (CUIs) of the subject and abstract of each article are
+added to the articles core by atomic updates after the import, so the slow
+MetaMap pass never blocks the import itself (see solr.run_enrich_cuis).
+
+Extracted CUIs are cached by the sha1 of the text given to MetaMap, in a
+sqlite database shared by the worker processes; articles whose text has
+been processed before (in an earlier or interrupted run, or a duplicate
+abstract) are never sent to MetaMap again.
+"""
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from config import config as cfg
+
+# fields of an article given to MetaMap
+CUI_SOURCE_FIELDS = ['subject', 'abstract']
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class CuiCache(object):
+    def __init__(self, path, timeout=60.):
+        """
+        :param path: sqlite database; created if not exists
+        :param timeout: seconds to wait for a lock held by another process
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        # readers do not block the writer (and the other way around)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS cuis ('
+                          'hash TEXT PRIMARY KEY, cuis TEXT, created REAL)')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_many(self, hashes):
+        """cached CUIs of the text hashes
+
+        :return: dict of hash -> list of CUIs, for the cached hashes only
+        """
+        found = dict()
+        hashes = list(hashes)
+        for i in range(0, len(hashes), 500):  # sqlite variable limit
+            chunk = hashes[i:i+500]
+            rows = self.conn.execute(
+                'SELECT hash, cuis FROM cuis WHERE hash IN ({})'.
+                format(','.join('?' * len(chunk))), chunk)
+            for h, cuis in rows:
+                found[h] = cuis.split(',') if cuis else []
+        return found
+
+    def put_many(self, results):
+        """store the CUIs of text hashes in one transaction
+
+        :param results: dict of hash -> list of CUIs
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO cuis VALUES (?, ?, ?)',
+                [(h, ','.join(cuis), now) for h, cuis in results.items()])
+
+    def close(self):
+        self.conn.close()
+
+
+def extract_cuis(mm, texts, batch=100):
+    """extract the CUIs of texts with MetaMap, batch texts per call
+
+    :param mm: MetaMap instance
+    :param texts: dict of text hash -> text
+    :param batch: number of texts per MetaMap call
+    :return: dict of text hash -> list of unique CUIs (in extracted order)
+    """
+    results = {h: [] for h in texts}
+    items = list(texts.items())
+    for i in range(0, len(items), batch):
+        chunk = items[i:i+batch]
+        # MetaMap reads one text per line
+        concepts, error = mm.extract_concepts(
+            [' '.join(text.split()) for _, text in chunk],
+            ids=[h for h, _ in chunk], **cfg.CONF_MM)
+        if error:
+            # do not cache partial results of a failed call
+            raise RuntimeError('metamap failed: {}'.format(error))
+        for c in concepts:
+            cui = getattr(c, 'cui', None)
+            # pymetamap writes (and reads back) the ids quoted
+            h = str(c.index).strip('\'"')
+            if cui and h in results and cui not in results[h]:
+                results[h].append(cui)
+    return results
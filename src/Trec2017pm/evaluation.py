@@ -0,0 +1,268 @@
+""" in-process evaluation of rankings, with the measures of trec_eval (map,
+bpref, P@k, infAP) and sample_eval (inferred AP and NDCG of stratified
+sampled judgments)
+
+Qrels are read once into arrays indexed by document. A run is evaluated as
+a matrix of the judgments of the ranked documents (topics x depth), so all
+the topics are scored together:
+
+    - trec qrels: topic iter docno rel; rel -1 for pooled but unjudged
+    - sample qrels: topic iter docno stratum rel; every document of the
+      pool is listed in its sampling stratum, rel -1 if not sampled
+
+As in trec_eval, the documents of a run file are ordered by decreasing
+score, then decreasing docno (ranks in the file are ignored); the overall
+value of a measure is the mean over the topics of the run with relevant
+documents.
+"""
+import os
+
+import numpy as np
+
+# cutoffs of P@k, as in trec_eval
+CUTOFFS = [5, 10, 15, 20, 30, 100, 200, 500, 1000]
+INFAP_EPSILON = 0.00001
+
+NONPOOL = -2  # judgment of a document not in the pool
+UNJUDGED = -1
+
+# qrels read by path; path -> (mtime, Qrels)
+_qrels = dict()
+
+
+def get_qrels(path, sampled=False):
+    """qrels of a file, read again only when the file has changed"""
+    mtime = os.path.getmtime(path)
+    if path not in _qrels or _qrels[path][0] != mtime:
+        _qrels[path] = (mtime, Qrels.load(path, sampled))
+    return _qrels[path][1]
+
+
+class Qrels(object):
+    def __init__(self, judgments, strata=None):
+        """
+        :param judgments: dict of topic -> dict of docno -> rel
+        :param strata: dict of topic -> dict of docno -> stratum (sample
+            qrels); judgments are of the sampled documents then
+        """
+        self.topics = sorted(judgments)
+        self.docs = dict()  # topic -> docno -> index
+        self.rel = dict()  # topic -> judgments by index
+        self.prob = dict()  # topic -> sampling probability by index
+        self.stratum = dict()  # topic -> stratum (code) by index
+        for t in self.topics:
+            docs = sorted(judgments[t])
+            self.docs[t] = {d: i for i, d in enumerate(docs)}
+            self.rel[t] = np.array([judgments[t][d] for d in docs],
+                                   dtype=np.int32)
+            self.prob[t] = np.ones(len(docs))
+            self.stratum[t] = np.zeros(len(docs), dtype=np.int32)
+            if strata is not None:
+                names = sorted(set(strata[t].values()))
+                self.stratum[t] = np.array(
+                    [names.index(strata[t][d]) for d in docs], dtype=np.int32)
+                # probability of a document of a stratum to be judged
+                for s in range(len(names)):
+                    in_s = self.stratum[t] == s
+                    judged = np.count_nonzero(self.rel[t][in_s] >= 0)
+                    self.prob[t][in_s] = judged / np.count_nonzero(in_s)
+        self.sampled = strata is not None
+
+    @classmethod
+    def load(cls, path, sampled=False):
+        """
+        :param sampled: sample qrels (with a stratum column)
+        """
+        judgments, strata = dict(), dict()
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 4:
+                    continue
+                t = int(fields[0])
+                judgments.setdefault(t, dict())[fields[2]] = int(fields[-1])
+                if sampled:
+                    strata.setdefault(t, dict())[fields[2]] = fields[3]
+        return cls(judgments, strata if sampled else None)
+
+    def judge(self, topic, ranking):
+        """judgments, sampling probabilities and strata (-1 out of the pool)
+        of a ranked list of docnos"""
+        docs = self.docs.get(topic, dict())
+        idx = np.array([docs.get(d, -1) for d in ranking], dtype=np.int64)
+        in_pool = idx >= 0
+        rel = np.full(len(idx), NONPOOL, dtype=np.int32)
+        prob = np.ones(len(idx))
+        stratum = np.full(len(idx), -1, dtype=np.int32)
+        if topic in self.rel:
+            rel[in_pool] = self.rel[topic][idx[in_pool]]
+            prob[in_pool] = self.prob[topic][idx[in_pool]]
+            stratum[in_pool] = self.stratum[topic][idx[in_pool]]
+        return rel, prob, stratum
+
+
+def read_run(path):
+    """rankings by topic of a run file, in the order of trec_eval"""
+    docs = dict()
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 6:
+                continue
+            docs.setdefault(int(fields[0]), []).append(
+                (float(fields[4]), fields[2]))
+    return {t: [d for _, d in sorted(r, reverse=True)]
+            for t, r in docs.items()}
+
+
+def _matrix(qrels, rankings, topics, depth):
+    """judgments, sampling probabilities and strata of the rankings of the
+    topics, padded with NONPOOL (topics x depth)"""
+    rel = np.full((len(topics), depth), NONPOOL, dtype=np.int32)
+    prob = np.ones((len(topics), depth))
+    stratum = np.full((len(topics), depth), -1, dtype=np.int32)
+    for i, t in enumerate(topics):
+        r, p, s = qrels.judge(t, rankings[t][:depth])
+        rel[i, :len(r)] = r
+        prob[i, :len(p)] = p
+        stratum[i, :len(s)] = s
+    return rel, prob, stratum
+
+
+def evaluate(rankings, qrels, qrels_s=None, depth=1000, level=1):
+    """evaluate the rankings of a run
+
+    :param rankings: dict of topic -> ranked docnos
+    :param qrels: trec qrels (map, bpref, P@k, infAP of trec_eval)
+    :param qrels_s: sample qrels (infAP and infNDCG of sample_eval);
+        inferred measures are not computed if None
+    :param depth: number of documents evaluated per topic
+    :param level: minimum relevance of a relevant document
+    :return: dict of measure -> dict of topic (and 'all') -> value
+    """
+    topics = sorted(t for t in rankings if t in qrels.rel and
+                    np.count_nonzero(qrels.rel[t] >= level) > 0)
+    if len(topics) == 0:
+        return dict()
+    depth = min(depth, max(len(rankings[t]) for t in topics))
+    rel, _, _ = _matrix(qrels, rankings, topics, depth)
+    num_rel = np.array([np.count_nonzero(qrels.rel[t] >= level)
+                        for t in topics], dtype=np.float64)
+    num_nonrel = np.array([np.count_nonzero(qrels.rel[t] == 0)
+                           for t in topics], dtype=np.float64)
+    ranks = np.arange(1, depth + 1)
+    is_rel = rel >= level
+    is_nonrel = (rel >= 0) & ~is_rel
+    rel_so_far = np.cumsum(is_rel, axis=1)
+
+    measures = dict()
+    measures['num_ret'] = np.array([len(rankings[t][:depth])
+                                    for t in topics])
+    measures['num_rel'] = num_rel
+    measures['num_rel_ret'] = rel_so_far[:, -1]
+    measures['map'] = (is_rel * rel_so_far / ranks).sum(axis=1) / num_rel
+
+    # judged nonrelevant documents ranked above
+    nonrel_above = np.cumsum(is_nonrel, axis=1) - is_nonrel
+    bounded = np.maximum(np.minimum(num_rel, num_nonrel), 1)[:, None]
+    measures['bpref'] = (is_rel * np.where(
+        nonrel_above > 0,
+        1. - np.minimum(nonrel_above, num_rel[:, None]) / bounded,
+        1.)).sum(axis=1) / num_rel
+
+    for k in CUTOFFS:
+        measures['P_{}'.format(k)] = rel_so_far[:, min(k, depth) - 1] / k
+
+    # trec_eval infAP: expected precision above each relevant document from
+    # the judged documents above it
+    rel_above = rel_so_far - is_rel
+    judged_above = rel_above + nonrel_above
+    pool_above = np.cumsum(rel >= UNJUDGED, axis=1) - (rel >= UNJUDGED)
+    below = ranks - 1
+    exp_prec = 1. / ranks + below / ranks * \
+        (pool_above / np.maximum(below, 1)) * \
+        ((rel_above + INFAP_EPSILON) / (judged_above + 2 * INFAP_EPSILON))
+    exp_prec[:, 0] = 1.
+    measures['infAP'] = (is_rel * exp_prec).sum(axis=1) / num_rel
+
+    result = {m: dict(zip(topics, v.tolist())) for m, v in measures.items()}
+    for m, v in measures.items():
+        result[m]['all'] = float(v.sum()) if m.startswith('num_') else \
+            float(v.mean())
+
+    if qrels_s is not None:
+        inferred = _evaluate_sampled(rankings, qrels_s, topics, depth, level)
+        for m, v in inferred.items():
+            result['s_' + m] = v
+    return result
+
+
+def _evaluate_sampled(rankings, qrels, topics, depth, level):
+    """inferred AP (xinfAP) and NDCG of stratified sampled judgments
+    (Yilmaz et al., 2008), as in sample_eval"""
+    topics = [t for t in topics if t in qrels.rel]
+    rel, prob, stratum = _matrix(qrels, rankings, topics, depth)
+    ranks = np.arange(1, depth + 1)
+    in_pool = rel >= UNJUDGED
+    judged = rel >= 0
+    is_rel = rel >= level
+    # inverse inclusion probability (prob is 0 for the unjudged documents of
+    # a stratum without judged ones)
+    weight = np.divide(1., prob, out=np.zeros(prob.shape), where=judged)
+
+    # estimated number of relevant documents (and by relevance, for NDCG)
+    est_rel = np.array([(1. / qrels.prob[t][qrels.rel[t] >= level]).sum()
+                        for t in topics])
+
+    # expected precision above each rank: the relevant part of the pool
+    # documents above it, estimated by stratum from the sampled ones
+    exp_prec_above = np.zeros(rel.shape)
+    for s in np.unique(stratum[in_pool]):
+        in_s = stratum == s
+        pool_s = np.cumsum(in_s, axis=1) - in_s
+        rel_s = np.cumsum(in_s & is_rel, axis=1) - (in_s & is_rel)
+        judged_s = np.cumsum(in_s & judged, axis=1) - (in_s & judged)
+        exp_prec_above += pool_s * (rel_s + INFAP_EPSILON) / \
+            (judged_s + 2 * INFAP_EPSILON)
+    below = ranks - 1
+    exp_prec = 1. / ranks + below / ranks * exp_prec_above / \
+        np.maximum(below, 1)
+    exp_prec[:, 0] = 1.
+    # 0 for a topic without sampled relevant documents, as in sample_eval
+    inf_ap = np.divide((is_rel * weight * exp_prec).sum(axis=1), est_rel,
+                       out=np.zeros(len(topics)), where=est_rel > 0)
+
+    # inferred DCG with the relevance as the gain, over the ideal DCG of the
+    # estimated number of documents by relevance
+    gain = np.where(is_rel, rel, 0) * weight
+    dcg = (gain / np.log2(ranks + 1)).sum(axis=1)
+    ideal = np.zeros(len(topics))
+    for i, t in enumerate(topics):
+        gains = []
+        for g in sorted(set(qrels.rel[t][qrels.rel[t] >= level]),
+                        reverse=True):
+            n = int(round((1. / qrels.prob[t][qrels.rel[t] == g]).sum()))
+            gains.extend([g] * n)
+        gains = np.array(gains, dtype=np.float64)
+        ideal[i] = (gains / np.log2(np.arange(2, len(gains) + 2))).sum()
+    inf_ndcg = dcg / np.where(ideal > 0, ideal, 1.)
+
+    result = {'infAP': dict(zip(topics, inf_ap.tolist())),
+              'infNDCG': dict(zip(topics, inf_ndcg.tolist()))}
+    for m in result:
+        result[m]['all'] = float(np.mean(list(result[m].values())))
+    return result
+
+
+def format_results(result, measures=None):
+    """results in the output format of trec_eval -q (measure, topic,
+    value), topics first and 'all' last"""
+    lines = []
+    for m in measures or sorted(result):
+        topics = sorted(k for k in result[m] if k != 'all') + ['all']
+        for t in topics:
+            v = result[m][t]
+            value = '{:d}'.format(int(v)) if m.startswith('num_') else \
+                '{:.4f}'.format(v)
+            lines.append('{:<22}\t{}\t{}'.format(m, t, value))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,129 @@
+""" import journal: the files already imported into solr
+
+One line per imported file, appended when the update holding the file has
+been accepted by solr:
+
+    <path>\t<fingerprint>
+
+The journal is loaded into a dict for constant-time lookups. A file whose
+fingerprint (size and mtime by default, or a content hash) has changed since
+it was recorded is not considered imported.
+Lines are flushed and fsync'ed per acknowledged batch, and a partially
+written last line (crash while writing) is ignored on load, so a resumed
+import re-sends exactly the batches that were not acknowledged.
+
+Plain path-per-line files written by older versions (--skip_files) are
+read as entries without fingerprints, i.e. always skipped. Files removed
+from the index are recorded as tombstones (<path>\t-).
+"""
+import os
+import sys
+import hashlib
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from Trec2017pm import sources
+
+
+def file_fingerprint(file):
+    """size and mtime of a file (or an archive member), or None if it cannot
+    be read"""
+    return sources.fingerprint(file)
+
+
+def content_fingerprint(file):
+    """sha1 of the file content, or None if it cannot be read; unlike the
+    default fingerprint, unchanged files keep it over re-extraction"""
+    try:
+        with sources.open_source(file) as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (OSError, KeyError):
+        return None
+
+
+class ImportJournal(object):
+    def __init__(self, path, fingerprint=file_fingerprint):
+        """
+        :param path: journal file; created if not exists
+        :param fingerprint: function returning a string that changes when
+            the content of a source file changes
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries = dict()  # file -> fingerprint (None if not recorded)
+        self._computed = dict()  # file -> fingerprint computed on lookup
+
+        if os.path.exists(path):
+            end = 0  # end of the last complete line
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # interrupted write
+                    end += len(line)
+                    file, _, fp = line.decode().rstrip('\n').partition('\t')
+                    if len(file) == 0:
+                        continue
+                    if fp == '-':
+                        self.entries.pop(file, None)
+                    else:
+                        self.entries[file] = fp if len(fp) > 0 else None
+            if end < os.path.getsize(path):
+                os.truncate(path, end)
+        self.fh = open(path, 'a')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, file):
+        if file not in self.entries:
+            return False
+        fp = self.entries[file]
+        if fp is None:
+            return True
+        current = self.fingerprint(file)
+        if fp == current:
+            return True
+        self._computed[file] = current  # reused when the file is recorded
+        return False
+
+    def record(self, files):
+        """durably record the files of an acknowledged update"""
+        lines = []
+        for file in files:
+            fp = self._computed.pop(file, None) or self.fingerprint(file) or ''
+            self.entries[file] = fp or None
+            lines.append('{}\t{}\n'.format(file, fp))
+        self._write(lines)
+
+    def forget(self, files):
+        """durably remove the files from the journal"""
+        lines = []
+        for file in files:
+            self.entries.pop(file, None)
+            lines.append('{}\t-\n'.format(file))
+        self._write(lines)
+
+    def compact(self):
+        """rewrite the journal with the current entries only (atomically)"""
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for file, fp in self.entries.items():
+                f.write('{}\t{}\n'.format(file, fp or ''))
+            f.flush()
+            os.fsync(f.fileno())
+        self.fh.close()
+        os.replace(tmp, self.path)
+        self.fh = open(self.path, 'a')
+
+    def _write(self, lines):
+        self.fh.write(''.join(lines))
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+
+    def close(self):
+        self.fh.close()
@@ -3,7 +3,6 @@ import os
 import sys
 import logging
 import argparse
-from twilio.rest import Client
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 from config import config as cfg
 
@@ -24,9 +23,16 @@ class Logger(object):
                             level=logging.INFO,
                             format='%(asctime)s %(levelname)s:: %(message)s')
 
-        # initialize twilio client
-        self.twilio_cl = Client(cfg.CONF_TWILIO['account_sid'],
-                                cfg.CONF_TWILIO['auth_token'])
+        # twilio client; created on the first message
+        self._twilio_cl = None
+
+    @property
+    def twilio_cl(self):
+        if self._twilio_cl is None:
+            from twilio.rest import Client
+            self._twilio_cl = Client(cfg.CONF_TWILIO['account_sid'],
+                                     cfg.CONF_TWILIO['auth_token'])
+        return self._twilio_cl
 
     def log(self, level, msg, die=False, printout=False):
         """
@@ -0,0 +1,270 @@
+""" MetaMap backends with the extract_concepts interface of pymetamap
+
+    - 'subprocess': pymetamap; one MetaMap process per call
+    - 'server': a pool of long-lived MetaMap processes reading phrases from
+      stdin (--sldiID, one citation per line) and marking the end of the
+      output of each phrase (-E), so the JVM/Prolog startup is paid once
+    - 'standin': deterministic concepts without MetaMap, with simulated
+      startup and per-phrase costs, to test and benchmark the expansion
+      code paths
+
+Both the server and the stand-in memoize the concepts by phrase.
+"""
+import os
+import sys
+import time
+import select
+import hashlib
+import threading
+import subprocess
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from config import config as cfg
+
+# fields of the MetaMap Indexing (MMI) output, as in pymetamap.ConceptMMI
+Concept = namedtuple('Concept', ['index', 'mm', 'score', 'preferred_name',
+                                 'cui', 'semtypes', 'trigger', 'location',
+                                 'pos_info', 'tree_codes'])
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_instance():
+    """MetaMap of the backend in CONF_METAMAP, shared in the process"""
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            conf = cfg.CONF_METAMAP
+            if conf['backend'] == 'server':
+                _instance = MetaMapPool(conf['path'], conf['servers'],
+                                        timeout=conf['timeout'],
+                                        **cfg.CONF_MM)
+            elif conf['backend'] == 'standin':
+                _instance = StandIn()
+            else:
+                from pymetamap import MetaMap
+                _instance = MetaMap.get_instance(conf['path'])
+        return _instance
+
+
+def _command(path, restrict_to_sts=None, composite_phrase=4, silent=True,
+             **kwargs):
+    """metamap command line of a server (options of CONF_MM)"""
+    command = [path, '-N', '-E', '--sldiID', '-Q', str(composite_phrase)]
+    if restrict_to_sts:
+        command.extend(['-J', ','.join(restrict_to_sts)])
+    if silent:
+        command.append('--silent')
+    return command
+
+
+class MetaMapServer(object):
+    def __init__(self, command, timeout=60.):
+        """
+        :param command: metamap command line reading stdin
+        :param timeout: seconds to wait for the next output line; the
+            process is killed (and started again on the next call) beyond
+        """
+        self.command = command
+        self.timeout = timeout
+        self.proc = None
+        self._buf = b''  # output read but not consumed as lines
+        self._lock = threading.Lock()  # one batch at a time
+
+    def _start(self):
+        if self.proc is None or self.proc.poll() is not None:
+            self.proc = subprocess.Popen(
+                self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, bufsize=0)
+            self._buf = b''
+
+    def _kill(self):
+        self.proc.kill()
+        self.proc.wait()
+        self.proc = None
+
+    def _readline(self):
+        """next output line, or '' at the end of the output; the output is
+        read unbuffered, so that select sees all of it"""
+        fd = self.proc.stdout.fileno()
+        while b'\n' not in self._buf:
+            ready, _, _ = select.select([fd], [], [], self.timeout)
+            if not ready:
+                self._kill()
+                raise RuntimeError('metamap server timed out ({}s without '
+                                   'output)'.format(self.timeout))
+            chunk = os.read(fd, 1 << 16)
+            if len(chunk) == 0:
+                return ''
+            self._buf += chunk
+        line, _, self._buf = self._buf.partition(b'\n')
+        return line.decode('utf-8', 'replace') + '\n'
+
+    def extract(self, phrases):
+        """concepts of the phrases
+
+        :return: list of lists of concepts, by phrase
+        """
+        with self._lock:
+            self._start()
+            lines = ['{}|{}\n'.format(i, ' '.join(
+                p.replace('|', ' ').split())) for i, p in enumerate(phrases)]
+
+            # write from another thread, so that a full output pipe never
+            # blocks the input
+            def write(stdin):
+                try:
+                    stdin.write(''.join(lines).encode('utf-8'))
+                    stdin.flush()
+                except (BrokenPipeError, ValueError):
+                    pass
+            writer = threading.Thread(target=write, args=(self.proc.stdin,),
+                                      daemon=True)
+            writer.start()
+
+            results = [[] for _ in phrases]
+            done = 0
+            while done < len(phrases):
+                line = self._readline()
+                if line == '':
+                    self._kill()
+                    raise RuntimeError('metamap server exited')
+                fields = line.rstrip('\n').split('|')
+                if len(fields) == 1:
+                    if 'EOT' in line:
+                        done += 1  # end of the output of a phrase
+                    continue
+                if len(fields) < len(Concept._fields) or fields[1] != 'MMI':
+                    continue  # AA/UA records, messages
+                c = Concept(*fields[:len(Concept._fields)])
+                results[int(c.index)].append(c)
+            writer.join()
+            return results
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc = None
+
+
+class _Memoized(object):
+    """extract_concepts on top of extract(phrases), memoized by phrase
+    (least recently used memo_size phrases)"""
+    def __init__(self, memo_size=100000):
+        self.memo = OrderedDict()
+        self.memo_size = memo_size
+        self._memo_lock = threading.Lock()
+
+    def extract_concepts(self, sentences, ids=None, **kwargs):
+        """same as pymetamap extract_concepts; the options are given when
+        the backend is created
+
+        :return: (list of concepts, error)
+        """
+        found = dict()
+        with self._memo_lock:
+            for s in sentences:
+                if s in self.memo:
+                    self.memo.move_to_end(s)
+                    found[s] = self.memo[s]
+        todo = [s for s in dict.fromkeys(sentences) if s not in found]
+        if len(todo) > 0:
+            try:
+                found.update(zip(todo, self.extract(todo)))
+            except (RuntimeError, OSError) as e:
+                return [], str(e)
+            with self._memo_lock:
+                for s in todo:
+                    self.memo[s] = found[s]
+                while len(self.memo) > self.memo_size:
+                    self.memo.popitem(last=False)
+        ids = ids if ids is not None else range(len(sentences))
+        concepts = []
+        for i, s in zip(ids, sentences):
+            concepts.extend(c._replace(index=i) for c in found[s])
+        return concepts, None
+
+
+class MetaMapPool(_Memoized):
+    def __init__(self, path, servers=1, timeout=60., **options):
+        """
+        :param path: metamap executable
+        :param servers: number of metamap processes
+        :param timeout: seconds to wait for the output of a server
+        :param options: metamap options (CONF_MM)
+        """
+        super(MetaMapPool, self).__init__()
+        command = _command(path, **options)
+        self.servers = [MetaMapServer(command, timeout)
+                        for _ in range(servers)]
+
+    def extract(self, phrases):
+        """split the phrases over the servers"""
+        n = len(self.servers)
+        chunks = [phrases[i::n] for i in range(n)]
+        with ThreadPoolExecutor(n) as executor:
+            parts = list(executor.map(lambda x: x[0].extract(x[1]) if x[1]
+                                      else [], zip(self.servers, chunks)))
+        results = [None] * len(phrases)
+        for i, part in enumerate(parts):
+            results[i::n] = part
+        return results
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+
+
+class StandIn(_Memoized):
+    def __init__(self, startup=0., latency=0., lexicon=None):
+        """
+        :param startup: seconds of simulated startup per extract call
+        :param latency: seconds of simulated work per phrase
+        :param lexicon: dict of normalized phrase -> (preferred name, cui);
+            other phrases map to their title-cased form
+        """
+        super(StandIn, self).__init__()
+        self.startup = startup
+        self.latency = latency
+        self.lexicon = lexicon or dict()
+        self.num_calls = 0
+
+    def extract(self, phrases):
+        self.num_calls += 1
+        time.sleep(self.startup + self.latency * len(phrases))
+        results = []
+        for p in phrases:
+            key = ' '.join(p.lower().split())
+            if len(key) == 0:
+                results.append([])
+                continue
+            name, cui = self.lexicon.get(key, (None, None))
+            name = name or key.title()
+            cui = cui or 'C{:07d}'.format(
+                int(hashlib.sha1(key.encode()).hexdigest(), 16) % 10000000)
+            results.append([Concept('0', 'MMI', '1000.00', name, cui,
+                                    '[gngm]', '["{}"-tx-1-"{}"]'.format(p, p),
+                                    'TX', '1/{}'.format(len(p)), '')])
+        return results
+
+    def close(self):
+        pass
+
+
+def bench(phrases, startup=2., latency=.01):
+    """compare one metamap call per phrase (subprocess backend) with one
+    batched call (server), both simulated by the stand-in
+
+    :return: (seconds per phrase, seconds batched)
+    """
+    t0 = time.time()
+    for p in phrases:
+        StandIn(startup, latency).extract_concepts([p])
+    t_single = time.time() - t0
+    t0 = time.time()
+    StandIn(startup, latency).extract_concepts(phrases)
+    return t_single, time.time() - t0
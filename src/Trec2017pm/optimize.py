@@ -0,0 +1,355 @@
+""" parallel search of the weights of the query templates (<WT1>..<WT8>)
+
+The score of a weight vector is the harmonic mean of infAP and infNDCG (as
+in runner._run_exp_optimize_weights) of its rankings on a set of topics.
+Batches of candidate vectors are evaluated concurrently by worker
+processes, each running the queries of its topics on the shared solr and
+evaluating the rankings in process (evaluation.py).
+
+The measures of each evaluated (vector, topic) are memoized, and journaled
+in a checkpoint file after the index version of the core:
+
+    {"version": index version}
+    {"w": [weights], "t": topic, "m": [infAP, infNDCG] or null}
+
+The strategies are deterministic for a seed, so a search resumed from its
+checkpoint replays the journaled evaluations without solr requests and
+continues where it stopped. Strategies:
+
+    - 'coordinate': each weight moved up and down by a step, all moves of
+      a round evaluated as a batch; the step is halved when no move helps
+    - 'cmaes': (mu/mu_w, lambda) evolution strategy with covariance matrix
+      and step size adaptation; a generation is a batch
+    - 'halving': successive halving of random candidates over growing
+      subsets of the topics; the best third goes on to three times more
+      topics
+"""
+import os
+import sys
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from config import config as cfg
+import Trec2017pm.logger as logger
+from Trec2017pm import rescore
+
+logger = logger.Logger()  # singleton
+
+# templates and qrels of a worker process (_init_worker)
+_worker = dict()
+
+
+def vector_key(weights):
+    """memo key of a weight vector: the weights as filled in the queries"""
+    return tuple(round(float(w), 6) for w in weights)
+
+
+def harmonic_mean(inf_ap, inf_ndcg):
+    if not (inf_ap > 0 and inf_ndcg > 0):  # nan too
+        return 0.
+    return 2 / ((1 / inf_ap) + (1 / inf_ndcg))
+
+
+def load_templates(path, topics=None):
+    """query templates (a<topic>.template) of a directory
+
+    :param topics: topic numbers; all the templates of the directory if None
+    :return: dict of topic -> template
+    """
+    templates = dict()
+    for file in os.listdir(path):
+        if file.startswith('a') and file.endswith('.template'):
+            t = int(file[1:-len('.template')])
+            if topics is None or t in topics:
+                with open(os.path.join(path, file)) as f:
+                    templates[t] = f.read()
+    return templates
+
+
+def _init_worker(templates, target):
+    from Trec2017pm import evaluation, solr
+    # connections inherited from the parent process are not to be shared
+    solr.SolrClient().session.close()
+    _worker['templates'] = templates
+    _worker['target'] = target
+    _worker['qrels'] = evaluation.get_qrels(cfg.PATHS['rel_file'])
+    _worker['qrels_s'] = evaluation.get_qrels(cfg.PATHS['rel_file_s'],
+                                              sampled=True)
+
+
+def _evaluate_topics(task):
+    """infAP and infNDCG of a weight vector on topics (worker process)
+
+    :param task: (weights, topics)
+    :return: dict of topic -> [infAP, infNDCG], or None for a topic without
+        relevant documents
+    """
+    from Trec2017pm import evaluation, solr
+    weights, topics = task
+    rankings = dict()
+    for t in topics:
+        query = rescore.fill_template(_worker['templates'][t], weights)
+        ranked = solr._query({'query': query}, _worker['target'])
+        rankings[t] = [doc_id for doc_id, _ in ranked]
+    result = evaluation.evaluate(rankings, _worker['qrels'],
+                                 _worker['qrels_s'])
+    if len(result) == 0:
+        return {t: None for t in topics}
+    return {t: [result['s_infAP'][t], result['s_infNDCG'][t]]
+            if t in result['s_infAP'] else None for t in topics}
+
+
+class Checkpoint(object):
+    def __init__(self, path, version=None):
+        """
+        :param path: journal of the evaluations; created if not exists
+        :param version: index version of the evaluations; the journal is
+            started over when it is of another version
+        """
+        self.memo = dict()  # (vector key, topic) -> [infAP, infNDCG]
+        self.fh = None
+        if path is None:
+            return
+        end = 0  # end of the last complete line
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # interrupted write
+                    e = json.loads(line.decode())
+                    if 'version' in e:
+                        if e['version'] != version:
+                            logger.log('INFO', 'checkpoint of index version '
+                                       '{} dropped [{}]'.format(e['version'],
+                                                                path))
+                            self.memo.clear()
+                            end = 0
+                            break
+                    else:
+                        self.memo[(vector_key(e['w']), e['t'])] = e['m']
+                    end += len(line)
+            if end < os.path.getsize(path):
+                os.truncate(path, end)
+        self.fh = open(path, 'a')
+        if end == 0:
+            self.fh.write(json.dumps({'version': version}) + '\n')
+
+    def record(self, weights, topic, measures):
+        self.memo[(vector_key(weights), topic)] = measures
+        if self.fh is not None:
+            self.fh.write(json.dumps({'w': list(vector_key(weights)),
+                                      't': topic, 'm': measures}) + '\n')
+
+    def flush(self):
+        if self.fh is not None:
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+
+class WeightSearch(object):
+    def __init__(self, templates, target='a', workers=1, checkpoint=None,
+                 version=None):
+        """
+        :param templates: dict of topic -> query template
+        :param workers: number of worker processes (1: in this process)
+        :param checkpoint: journal file of the evaluations, or None
+        :param version: index version of the target core (checkpoint)
+        """
+        self.topics = sorted(templates)
+        self.checkpoint = Checkpoint(checkpoint, version)
+        self.executor = None
+        if workers > 1:
+            self.executor = ProcessPoolExecutor(
+                workers, initializer=_init_worker,
+                initargs=(templates, target))
+        else:
+            _init_worker(templates, target)
+        self.num_evaluated = 0  # (vector, topic) evaluated on solr
+        self.num_memo = 0  # (vector, topic) found in the memo
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.checkpoint.close()
+
+    def evaluate(self, batch, topics=None):
+        """scores of a batch of weight vectors, evaluated concurrently
+
+        :param batch: weight vectors
+        :param topics: topics of the scores; all the topics if None
+        :return: array of scores
+        """
+        topics = self.topics if topics is None else sorted(topics)
+        memo = self.checkpoint.memo
+        tasks = []
+        for weights in dict.fromkeys(vector_key(w) for w in batch):
+            missing = [t for t in topics if (weights, t) not in memo]
+            self.num_memo += len(topics) - len(missing)
+            if len(missing) > 0:
+                tasks.append((weights, missing))
+        if self.executor is not None:
+            futures = [self.executor.submit(_evaluate_topics, task)
+                       for task in tasks]
+        # the evaluations completed before a failure are journaled, and the
+        # failure raised after them
+        error = None
+        for i, (weights, missing) in enumerate(tasks):
+            try:
+                measures = futures[i].result() if self.executor is not None \
+                    else _evaluate_topics((weights, missing))
+            except Exception as e:
+                error = error or e
+                if self.executor is None:
+                    break
+                continue
+            for t in missing:
+                self.checkpoint.record(weights, t, measures[t])
+            self.num_evaluated += len(missing)
+        self.checkpoint.flush()
+        if error is not None:
+            raise error
+
+        scores = []
+        for weights in batch:
+            measures = [memo[(vector_key(weights), t)] for t in topics]
+            measures = [m for m in measures if m is not None]
+            scores.append(harmonic_mean(*np.mean(measures, axis=0))
+                          if len(measures) > 0 else 0.)
+        return np.array(scores)
+
+
+def coordinate(search, x0, rng, step=.5, min_step=.01, budget=400):
+    """coordinate search; a round moves each weight up and down by the step
+
+    :param budget: maximum number of scored vectors
+    """
+    x = np.maximum(0, np.asarray(x0, dtype=np.float64))
+    score = search.evaluate([x])[0]
+    used = 1
+    while step >= min_step and used < budget:
+        moves = []
+        for i in range(len(x)):
+            for d in [step, -step]:
+                y = x.copy()
+                y[i] = max(0., y[i] + d)
+                if y[i] != x[i]:
+                    moves.append(y)
+        scores = search.evaluate(moves)
+        used += len(moves)
+        if scores.max() > score:
+            x, score = moves[int(scores.argmax())], scores.max()
+            logger.log('INFO', 'coordinate: {:.4f} (step {})'.
+                       format(score, step), printout=True)
+        else:
+            step /= 2
+    return x, score
+
+
+def cmaes(search, x0, rng, sigma=.5, popsize=8, budget=400):
+    """(mu/mu_w, lambda)-CMA-ES; weights are kept non-negative by mirroring
+
+    :param sigma: initial step size
+    :param popsize: candidates per generation (lambda)
+    :param budget: maximum number of scored vectors
+    """
+    n = len(x0)
+    mean = np.maximum(0, np.asarray(x0, dtype=np.float64))
+    mu = popsize // 2
+    w = np.log(mu + .5) - np.log(np.arange(1, mu + 1))
+    w /= w.sum()
+    mu_eff = 1 / (w ** 2).sum()
+    # default strategy parameters (Hansen, The CMA Evolution Strategy)
+    c_sigma = (mu_eff + 2) / (n + mu_eff + 5)
+    d_sigma = 1 + 2 * max(0, np.sqrt((mu_eff - 1) / (n + 1)) - 1) + c_sigma
+    c_c = (4 + mu_eff / n) / (n + 4 + 2 * mu_eff / n)
+    c_1 = 2 / ((n + 1.3) ** 2 + mu_eff)
+    c_mu = min(1 - c_1, 2 * (mu_eff - 2 + 1 / mu_eff) /
+               ((n + 2) ** 2 + mu_eff))
+    chi_n = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+    p_sigma, p_c, cov = np.zeros(n), np.zeros(n), np.eye(n)
+
+    best, best_score = mean, search.evaluate([mean])[0]
+    used, gen = 1, 0
+    while used < budget:
+        gen += 1
+        vals, vecs = np.linalg.eigh(cov)
+        sqrt_cov = vecs @ np.diag(np.sqrt(np.maximum(vals, 1e-20))) @ vecs.T
+        inv_sqrt = vecs @ np.diag(1 / np.sqrt(np.maximum(vals, 1e-20))) @ \
+            vecs.T
+        z = rng.standard_normal((popsize, n))
+        xs = np.abs(mean + sigma * z @ sqrt_cov.T)
+        scores = search.evaluate(xs)
+        used += popsize
+        order = np.argsort(-scores)
+        if scores[order[0]] > best_score:
+            best, best_score = xs[order[0]], scores[order[0]]
+            logger.log('INFO', 'cmaes: {:.4f} (generation {})'.
+                       format(best_score, gen), printout=True)
+
+        old = mean
+        ys = (xs[order[:mu]] - old) / sigma
+        mean = old + sigma * (w @ ys)
+        y_w = w @ ys
+        p_sigma = (1 - c_sigma) * p_sigma + \
+            np.sqrt(c_sigma * (2 - c_sigma) * mu_eff) * inv_sqrt @ y_w
+        h_sigma = np.linalg.norm(p_sigma) / \
+            np.sqrt(1 - (1 - c_sigma) ** (2 * gen)) < (1.4 + 2 / (n + 1)) * chi_n
+        p_c = (1 - c_c) * p_c + \
+            h_sigma * np.sqrt(c_c * (2 - c_c) * mu_eff) * y_w
+        cov = (1 - c_1 - c_mu) * cov + \
+            c_1 * (np.outer(p_c, p_c) +
+                   (1 - h_sigma) * c_c * (2 - c_c) * cov) + \
+            c_mu * (ys.T * w) @ ys
+        sigma *= np.exp((c_sigma / d_sigma) *
+                        (np.linalg.norm(p_sigma) / chi_n - 1))
+    return best, best_score
+
+
+def halving(search, x0, rng, candidates=81, eta=3, sigma=.5):
+    """successive halving over topic subsets: all candidates are scored on a
+    few topics, and the best 1/eta of them on eta times more topics, up to
+    all the topics
+
+    :param candidates: number of random candidates; x0 and gaussian and
+        uniform variations of it (as _run_exp_optimize_weights)
+    """
+    x0 = np.maximum(0, np.asarray(x0, dtype=np.float64))
+    n = len(x0)
+    half = (candidates - 1) // 2
+    xs = np.vstack([x0[None, :],
+                    np.maximum(0, rng.normal(x0, sigma, (half, n))),
+                    rng.uniform(0, 3, (candidates - 1 - half, n))])
+    topics = [int(t) for t in rng.permutation(search.topics)]
+    rungs = max(1, int(np.ceil(np.log(len(xs)) / np.log(eta))))
+    size = max(1, int(np.ceil(len(topics) / eta ** (rungs - 1))))
+    while True:
+        subset = topics[:size]
+        scores = search.evaluate(xs, subset)
+        logger.log('INFO', 'halving: {} candidates on {} topics, best {:.4f}'.
+                   format(len(xs), len(subset), scores.max()), printout=True)
+        if len(subset) == len(topics) or len(xs) == 1:
+            if len(subset) < len(topics):
+                scores = search.evaluate(xs)
+            i = int(scores.argmax())
+            return xs[i], scores[i]
+        keep = np.argsort(-scores)[:max(1, len(xs) // eta)]
+        xs = xs[keep]
+        size = min(len(topics), size * eta)
+
+
+STRATEGIES = {'coordinate': coordinate, 'cmaes': cmaes, 'halving': halving}
@@ -0,0 +1,304 @@
+""" import pipeline shared by the solr importers
+
+Three stages joined by bounded queues:
+    - discovery: feeds the source files that are not imported yet
+    - transform: converts a file into serialized solr documents (optionally
+      in a pool of worker processes), and collates them into batches
+    - post: a number of threads sending the update requests concurrently
+
+Source files are acknowledged (on_ack) only after every batch holding their
+documents has been accepted by solr, no matter in which order files and
+batches finish.
+
+Documents are posted as xml or json (payload), optionally gzip-compressed.
+Batches are cut by payload size (batch_bytes) or by a document count cap
+(batch). The byte target adapts to solr: it shrinks when an update is slow
+or rejected for its payload (413 or 5xx; the batch is re-sent in halves),
+and grows while solr keeps up within the target latency. Connection errors
+and timeouts abort the import.
+
+Commit policies (CONF_IMPORT['commit']):
+    - 'final': no commits while importing; one explicit commit at the end
+    - 'within': each update asks solr to commit within commit_within ms
+    - 'every': hard commit with every commit_every-th update request
+"""
+import os
+import sys
+import gzip
+import time
+import queue
+import threading
+from multiprocessing import Pool
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from Trec2017pm.logger import Logger
+
+logger = Logger()  # singleton
+
+
+def xml_payload(docs):
+    """wrap serialized <doc> elements in a solr <add> request"""
+    return b'<add>' + b''.join(docs) + b'</add>'
+
+
+def json_payload(docs):
+    """wrap serialized json documents in a solr json update request"""
+    return b'[' + b','.join(docs) + b']'
+
+
+# request headers by the payload function
+HEADERS = {
+    xml_payload: {'content-type': 'text/xml; charset=utf-8'},
+    json_payload: {'content-type': 'application/json; charset=utf-8'},
+}
+
+
+def _run_transform(args):
+    """transform a file in a worker process (results must be picklable)"""
+    transform, file = args
+    return file, list(transform(file))
+
+
+class ImportPipeline(object):
+    def __init__(self, url, transform, post, batch=5000, workers=1,
+                 posters=1, queue_depth=8, initializer=None, initargs=(),
+                 payload=xml_payload, on_ack=None, commit='final',
+                 commit_within=60000, commit_every=10, optimize=False,
+                 batch_bytes=4 << 20, batch_bytes_min=256 << 10,
+                 batch_bytes_max=32 << 20, latency=2., gzip=False):
+        """
+        :param url: solr update url
+        :param transform: module-level function mapping a file path to an
+            iterable of serialized solr documents
+        :param post: function (url, data, headers, params) that posts an
+            update request, and raises if it finally fails
+        :param batch: maximum number of documents per update request
+        :param workers: number of transform processes
+        :param posters: number of update requests in flight
+        :param queue_depth: capacity of the queues between stages
+        :param initializer: called once in every transform process
+        :param payload: xml_payload or json_payload, by the format of the
+            documents the transform produces
+        :param on_ack: called with the list of files completed by an
+            accepted update request
+        :param commit: commit policy; 'final', 'within' or 'every'
+        :param commit_within: commitWithin in milliseconds ('within')
+        :param commit_every: number of update requests per commit ('every')
+        :param optimize: optimize the index instead of the final commit
+        :param batch_bytes: initial target payload size in bytes
+        :param batch_bytes_min: lower bound of the adaptive target
+        :param batch_bytes_max: upper bound of the adaptive target
+        :param latency: target seconds per update request
+        :param gzip: compress the payloads (Content-Encoding: gzip); solr
+            must accept compressed requests (e.g. jetty GzipHandler with
+            inflateBufferSize > 0)
+        """
+        assert commit in ['final', 'within', 'every'], \
+            "commit policy is undefined"
+        self.url = url
+        self.transform = transform
+        self.post = post
+        self.batch = batch
+        self.workers = max(1, workers)
+        self.posters = max(1, posters)
+        self.queue_depth = queue_depth
+        self.initializer = initializer
+        self.initargs = initargs
+        self.payload = payload
+        self.headers = dict(HEADERS[payload])
+        self.gzip = gzip
+        if gzip:
+            self.headers['content-encoding'] = 'gzip'
+        self.on_ack = on_ack
+        self.commit_policy = commit
+        self.commit_within = commit_within
+        self.commit_every = commit_every
+        self.optimize = optimize
+        self.batch_bytes = batch_bytes
+        self.batch_bytes_min = batch_bytes_min
+        self.batch_bytes_max = batch_bytes_max
+        self.latency = latency
+
+        self._lock = threading.Lock()
+        self._refs = dict()  # file -> open batches (+1 while collating)
+        self._error = None
+        self.num_docs = 0
+        self.num_requests = 0
+        self.num_commits = 0
+        self.num_bytes = 0
+
+    def run(self, files, commit=True):
+        """import the given files
+
+        :param commit: issue the final commit (or optimize) when done; leave
+            it to a later run of the same pipeline otherwise
+        """
+        file_q = queue.Queue(self.queue_depth)
+        post_q = queue.Queue(self.queue_depth)
+
+        # - stage 1: discovery
+        def discover():
+            for file in files:
+                file_q.put(file)
+            file_q.put(None)
+        threads = [threading.Thread(target=discover, daemon=True)]
+
+        # - stage 3: post
+        for _ in range(self.posters):
+            threads.append(threading.Thread(target=self._poster,
+                                            args=(post_q,), daemon=True))
+        for t in threads:
+            t.start()
+
+        # - stage 2: transform and collate
+        pool = None
+        todo = iter(file_q.get, None)
+        if self.workers > 1:
+            pool = Pool(self.workers, initializer=self.initializer,
+                        initargs=self.initargs)
+            results = pool.imap_unordered(
+                _run_transform, ((self.transform, f) for f in todo))
+        else:
+            if self.initializer is not None:
+                self.initializer(*self.initargs)
+            results = ((f, self.transform(f)) for f in todo)
+
+        try:
+            docs, batch_files, size = [], set(), 0
+            for file, file_docs in results:
+                if self._error is not None:
+                    break
+                with self._lock:
+                    self._refs[file] = 1
+                for doc in file_docs:
+                    if file not in batch_files:
+                        batch_files.add(file)
+                        with self._lock:
+                            self._refs[file] += 1
+                    docs.append(doc)
+                    size += len(doc)
+                    if len(docs) >= self.batch or size >= self.batch_bytes:
+                        post_q.put((docs, batch_files))
+                        docs, batch_files, size = [], set(), 0
+                self._release([file])
+            if len(docs) > 0:
+                post_q.put((docs, batch_files))
+        finally:
+            for _ in range(self.posters):
+                post_q.put(None)
+            for t in threads[1:]:
+                t.join()
+            if pool is not None:
+                pool.terminate()
+
+        if self._error is not None:
+            raise self._error
+        if commit:
+            self.commit()
+        logger.log('INFO', '{} docs imported in {} update requests, {} '
+                           'commits'.format(self.num_docs, self.num_requests,
+                                            self.num_commits), printout=True)
+        if self.num_requests > 0:
+            logger.log('INFO', 'average payload {} bytes, final batch size '
+                               '{} bytes'.format(
+                                   self.num_bytes // self.num_requests,
+                                   self.batch_bytes), printout=True)
+
+    def commit(self):
+        """send an explicit commit (or optimize) request"""
+        params = {'optimize' if self.optimize else 'commit': 'true'}
+        self.post(self.url, None, self.headers, params)
+        with self._lock:
+            self.num_commits += 1
+
+    def _params(self):
+        """request parameters of the next update by the commit policy"""
+        with self._lock:
+            self.num_requests += 1
+            if self.commit_policy == 'within':
+                return {'commitWithin': self.commit_within}
+            if self.commit_policy == 'every' and \
+                    self.num_requests % self.commit_every == 0:
+                return {'commit': 'true'}
+        return None
+
+    def _poster(self, post_q):
+        while True:
+            item = post_q.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue  # drain the queue so that the collator never blocks
+            docs, batch_files = item
+            try:
+                self._post_batch(docs)
+            except Exception as e:
+                self._error = e
+                continue
+            self._release(batch_files)
+
+    def _post_batch(self, docs):
+        """post a batch, and adapt the batch size to the response; a batch
+        rejected for its payload (413 or 5xx) is split in halves and
+        re-sent, down to batch_bytes_min
+
+        The batch size is accounted in uncompressed bytes (as the collator
+        cuts batches), and num_bytes counts the bytes on the wire.
+        """
+        data = self.payload(docs)
+        size = len(data)
+        if self.gzip:
+            data = gzip.compress(data, compresslevel=1)
+        params = self._params()
+        t0 = time.time()
+        try:
+            self.post(self.url, data, self.headers, params)
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 0
+            if status != 413 and status < 500 or \
+                    len(docs) < 2 or size <= self.batch_bytes_min:
+                raise
+            self._adapt(size, None)
+            half = len(docs) // 2
+            logger.log('WARNING', 'update of {} bytes failed ({}); re-sending '
+                                  'in halves'.format(size, status),
+                       printout=True)
+            self._post_batch(docs[:half])
+            self._post_batch(docs[half:])
+            return
+        self._adapt(size, time.time() - t0)
+        with self._lock:
+            self.num_docs += len(docs)
+            self.num_bytes += len(data)
+            if params is not None and 'commit' in params:
+                self.num_commits += 1
+
+    def _adapt(self, size, latency):
+        """shrink the target batch size on slow (or failed, latency None)
+        updates, grow it while updates of a full batch are fast"""
+        with self._lock:
+            prev = self.batch_bytes
+            if latency is None or latency > 2 * self.latency:
+                self.batch_bytes = max(self.batch_bytes_min, prev // 2)
+            elif latency < self.latency / 2 and size >= prev * 0.8:
+                self.batch_bytes = min(self.batch_bytes_max, int(prev * 1.25))
+            curr = self.batch_bytes
+        if curr != prev:
+            logger.log('INFO', 'batch size {} -> {} bytes (payload {} bytes, '
+                               'latency {})'.format(
+                                   prev, curr, size, 'failed' if latency is
+                                   None else '{:.2f}s'.format(latency)))
+
+    def _release(self, files):
+        """drop a reference of the files, and acknowledge completed ones"""
+        with self._lock:
+            done = []
+            for file in files:
+                self._refs[file] -= 1
+                if self._refs[file] == 0:
+                    del self._refs[file]
+                    done.append(file)
+            if len(done) > 0 and self.on_ack is not None:
+                self.on_ack(done)
@@ -0,0 +1,160 @@
+""" on-disk cache of solr query responses
+
+Experiments and weight searches run the same topic queries again and
+again; a response is kept by the sha1 of its core, query body, request
+params and the version of the core's index, so a query is sent to solr
+once per index version. Entries of older index versions are dropped when
+a new version is seen (invalidate), and the least recently used responses
+are evicted beyond max_bytes.
+
+The size of the cached responses is kept as a running total (meta table),
+and the use time of a response is updated on a hit only when it is older
+than touch_after, so neither a get nor a put scans the table.
+
+The cache is a sqlite database, shared by the threads and processes of
+the runs like the concept store (see concepts.py).
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from config import config as cfg
+
+# caches of the current process; pid -> {path: cache}
+_caches = dict()
+
+
+def get_cache():
+    """response cache of the current process (PATHS['solr-cache'])"""
+    opened = _caches.setdefault(os.getpid(), dict())
+    path = cfg.PATHS['solr-cache']
+    if path not in opened:
+        opened[path] = ResponseCache(path, cfg.CONF_SOLR['cache_size'])
+    return opened[path]
+
+
+def response_key(core, version, body, params):
+    """content address of a query response"""
+    return hashlib.sha1(json.dumps([core, version, body, params],
+                                   sort_keys=True).encode()).hexdigest()
+
+
+class ResponseCache(object):
+    def __init__(self, path, max_bytes=1 << 30, timeout=60.,
+                 touch_after=3600.):
+        """
+        :param path: sqlite database; created if not exists
+        :param max_bytes: size of the cached responses to keep; the least
+            recently used are evicted down to 90% of it
+        :param timeout: seconds to wait for a lock held by another writer
+        :param touch_after: seconds before a hit updates the use time of a
+            response (LRU order at that granularity)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.touch_after = touch_after
+        self._local = threading.local()  # a connection per thread
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                         'key TEXT PRIMARY KEY, core TEXT, version TEXT, '
+                         'response TEXT, size INTEGER, used REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS responses_used '
+                         'ON responses (used)')
+            # total size of the responses (computed once for older caches)
+            conn.execute('CREATE TABLE IF NOT EXISTS meta ('
+                         'id INTEGER PRIMARY KEY CHECK (id = 0), '
+                         'total INTEGER)')
+            conn.execute('INSERT OR IGNORE INTO meta SELECT 0, '
+                         'COALESCE(SUM(size), 0) FROM responses')
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            # readers do not block the writer (and the other way around)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """cached response text of a key, or None"""
+        conn = self._conn()
+        row = conn.execute('SELECT response, used FROM responses WHERE key=?',
+                           (key,)).fetchone()
+        now = time.time()
+        if row is not None and now - row[1] > self.touch_after:
+            with conn:
+                conn.execute('UPDATE responses SET used=? WHERE key=?',
+                             (now, key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row[0] if row is not None else None
+
+    def put(self, key, core, version, response):
+        """store a response text, then evict the least recently used
+        responses beyond max_bytes"""
+        size = len(response.encode())
+        with self._conn() as conn:
+            # the size of a replaced response and the total are read and
+            # updated under the write lock
+            conn.execute('BEGIN IMMEDIATE')
+            old = conn.execute('SELECT size FROM responses WHERE key=?',
+                               (key,)).fetchone()
+            conn.execute('INSERT OR REPLACE INTO responses VALUES '
+                         '(?, ?, ?, ?, ?, ?)',
+                         (key, core, version, response, size, time.time()))
+            total = self._add_total(conn, size - (old[0] if old else 0))
+            if total > self.max_bytes:
+                target = self.max_bytes * 9 // 10
+                evict, freed = [], 0
+                for k, s in conn.execute('SELECT key, size FROM responses '
+                                         'ORDER BY used'):
+                    if total - freed <= target:
+                        break
+                    evict.append((k,))
+                    freed += s
+                conn.executemany('DELETE FROM responses WHERE key=?', evict)
+                self._add_total(conn, -freed)
+
+    @staticmethod
+    def _add_total(conn, delta):
+        """add to the total size of the responses; the new total"""
+        conn.execute('UPDATE meta SET total = total + ? WHERE id = 0',
+                     (delta,))
+        return conn.execute('SELECT total FROM meta WHERE id = 0').\
+            fetchone()[0]
+
+    def invalidate(self, core, version):
+        """drop the responses of the other index versions of a core
+
+        :return: number of dropped responses
+        """
+        with self._conn() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            freed = conn.execute('SELECT COALESCE(SUM(size), 0) '
+                                 'FROM responses WHERE core=? AND version!=?',
+                                 (core, version)).fetchone()[0]
+            dropped = conn.execute('DELETE FROM responses WHERE core=? AND '
+                                   'version!=?', (core, version)).rowcount
+            self._add_total(conn, -freed)
+            return dropped
+
+    def reset_counters(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
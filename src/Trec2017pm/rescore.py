@@ -0,0 +1,148 @@
+""" offline rescoring of the weighted query templates
+
+The score of a document for a query template is the weighted sum of the
+scores of its clauses (WT1..WT8 of weight_template.py), and neither the
+clause scores nor the matching documents depend on the weights. The clause
+scores of the candidate documents of each topic are extracted from solr
+once (solr.extract_features) into a FeatureCache; rankings and evaluation
+scores of any number of weight vectors are then computed with numpy, with
+no solr requests.
+
+Candidates are the documents ranked high by the clauses; a document outside
+of them may be missed by an extreme weight vector, so the final weights are
+to be confirmed against solr.
+"""
+import numpy as np
+
+# clauses of the query templates, in the order of the weights (<WT1>..)
+CLAUSES = ['disease', 'meshDisease', 'gene', 'meshGene', 'mutation',
+           'meshMutation', 'meshDemo', 'conjunctive']
+
+
+def fill_template(template, weights):
+    """query of a template with the given weights"""
+    for i, wt in enumerate(weights):
+        template = template.replace('<WT{}>'.format(i+1),
+                                    str(round(float(wt), 6)))
+    return template
+
+
+def load_qrels(path):
+    """relevant documents by topic of a trec qrels file
+
+    :return: dict of topic no -> set of document ids
+    """
+    qrels = dict()
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 4 and float(fields[-1]) > 0:
+                qrels.setdefault(int(fields[0]), set()).add(fields[2])
+    return qrels
+
+
+class FeatureCache(object):
+    def __init__(self, features, version=None):
+        """
+        :param features: dict of topic no -> (ids, matrix); ids of the
+            candidate documents and their clause scores (n x len(CLAUSES))
+        :param version: index version of the core the scores come from
+        """
+        self.topics = sorted(features)
+        self.ids = {t: np.asarray(features[t][0]) for t in self.topics}
+        self.matrix = {t: np.asarray(features[t][1], dtype=np.float32)
+                       for t in self.topics}
+        self.version = version
+
+    def save(self, path):
+        arrays = {'version': np.array(self.version or '')}
+        for t in self.topics:
+            arrays['ids_{}'.format(t)] = self.ids[t]
+            arrays['matrix_{}'.format(t)] = self.matrix[t]
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            topics = [int(k.split('_')[1]) for k in data.files
+                      if k.startswith('ids_')]
+            features = {t: (data['ids_{}'.format(t)],
+                            data['matrix_{}'.format(t)]) for t in topics}
+            version = str(data['version']) or None
+        return cls(features, version)
+
+    def scores(self, topic, weights):
+        """scores of the candidates of a topic for many weight vectors
+
+        :param weights: array of weight vectors (m x len(CLAUSES))
+        :return: array of scores (m x n)
+        """
+        return np.asarray(np.atleast_2d(weights), np.float32) @ \
+            self.matrix[topic].T
+
+    def rank(self, topic, weights, k=1000):
+        """top documents of a topic for many weight vectors
+
+        :return: array of candidate indexes by rank (m x min(k, n))
+        """
+        scores = self.scores(topic, weights)
+        n = scores.shape[1]
+        if n > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(n), scores.shape)
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1,
+                           kind='stable')
+        return np.take_along_axis(top, order, axis=1)
+
+    def rankings(self, weights, k=1000):
+        """rankings (document ids by topic) of a weight vector"""
+        return {t: list(self.ids[t][self.rank(t, weights, k)[0]])
+                for t in self.topics}
+
+    def relevance(self, qrels):
+        """relevance of the candidates by topic, and the number of relevant
+        documents of the topics"""
+        rel = {t: np.isin(self.ids[t], list(qrels.get(t, ())))
+               for t in self.topics}
+        num_rel = {t: len(qrels.get(t, ())) for t in self.topics}
+        return rel, num_rel
+
+    def relevant_ranks(self, topic, weights, rel):
+        """ranks (from 0) of the relevant candidates of a topic for many
+        weight vectors, without ranking all the candidates: the number of
+        candidates of a higher score, in increasing order (ties of relevant
+        candidates are ranked one after the other)
+
+        :return: array of ranks (m x number of relevant candidates)
+        """
+        scores = self.scores(topic, weights)
+        ordered = np.sort(scores, axis=1)
+        rel_scores = scores[:, rel]
+        n = scores.shape[1]
+        ranks = np.empty(rel_scores.shape, dtype=np.int64)
+        for i in range(len(scores)):
+            ranks[i] = n - np.searchsorted(ordered[i], rel_scores[i],
+                                           side='right')
+        ranks.sort(axis=1)
+        seq = np.arange(ranks.shape[1])
+        return np.maximum.accumulate(ranks - seq, axis=1) + seq
+
+    def average_precision(self, weights, rel, num_rel, k=1000):
+        """average precision (trec_eval map) of weight vectors
+
+        :param weights: array of weight vectors (m x len(CLAUSES))
+        :param rel, num_rel: relevance of the candidates (relevance())
+        :return: array of mean average precisions over the topics (m)
+        """
+        weights = np.atleast_2d(weights)
+        total = np.zeros(len(weights))
+        for t in self.topics:
+            if num_rel[t] == 0:
+                continue
+            ranks = self.relevant_ranks(t, weights, rel[t])
+            found = np.arange(1, ranks.shape[1] + 1)
+            total += np.where(ranks < k, found / (ranks + 1), 0.).sum(
+                axis=1) / num_rel[t]
+        return total / max(1, sum(1 for t in self.topics if num_rel[t] > 0))
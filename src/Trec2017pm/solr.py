@@ -5,15 +5,83 @@ import re
 import requests
 import json
 import pprint
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 from config import config as cfg
 import Trec2017pm.logger as logger
+from Trec2017pm.logger import singleton
 import Trec2017pm.utils as utils
+import Trec2017pm.transform as transform
+import Trec2017pm.sources as sources
+import Trec2017pm.enrich as enrich
+import Trec2017pm.metamap as metamap
+import Trec2017pm.rescache as rescache
+from Trec2017pm.pipeline import ImportPipeline, json_payload, xml_payload
+from Trec2017pm.journal import ImportJournal, content_fingerprint
 
 logger = logger.Logger()  # singleton
 pp = pprint.PrettyPrinter(indent=4)
 
+# index versions of the cores in the current run (response cache)
+_index_versions = dict()
+
+
+@singleton
+class SolrClient(object):
+    """solr http client sharing a pool of keep-alive connections among the
+    import and query paths (and their threads)"""
+    def __init__(self):
+        conf = cfg.CONF_SOLR
+        self.base_url = conf['url'].rstrip('/')
+        self.cores = conf['cores']
+        self.timeout = conf['timeout']
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=len(self.cores), pool_maxsize=conf['pool_size'],
+            pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def url(self, target, handler):
+        """url of a request handler of a core, by its target ('a' or 't')"""
+        return "{}/{}/{}".format(self.base_url, self.cores[target], handler)
+
+    def update(self, url, data, headers, params=None, attempts=3):
+        """post an update request to solr, retrying on non-200 responses"""
+        while True:
+            try:
+                r = self.session.post(url, data=data, headers=headers,
+                                      params=params, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                logger.log('ERROR', 'request exception: {}'.format(e),
+                           die=True, printout=True)
+                raise
+
+            if r.status_code == 200:
+                return r
+            attempts -= 1
+            logger.log('ERROR', 'requests error:')
+            logger.log('ERROR', r.text)
+            if attempts <= 0:
+                logger.log('CRITICAL', 'terminating', die=True, printout=True)
+                r.raise_for_status()
+
+    def query(self, target, body, params=None):
+        """run a json query on the core of the target, return the response"""
+        headers = {
+            'content-type': 'application/json',
+            'Accept-Charset': 'UTF-8'}
+        return self.session.post(self.url(target, 'query'), params=params,
+                                 data=json.dumps(body), headers=headers,
+                                 timeout=self.timeout)
+
 
 def run_import_docs():
     """
@@ -24,8 +92,6 @@ def run_import_docs():
     enough for importing medline docs. Increase it to 4g as below:
     "./solr restart -m 4g"
     """
-    import gzip
-
     # - read xsl file
     if not os.path.isfile(cfg.PATHS['xsl-article']):
         logger.log('ERROR', 'xsl-article [{}] cannot be found'.
@@ -33,23 +99,11 @@ def run_import_docs():
     else:
         logger.log('DEBUG', 'reading xsl file for medline xml files')
 
-    try:
-        xslt = et.parse(cfg.PATHS['xsl-article'])
-        transformer = et.XSLT(xslt)
-    except:
-        e = sys.exc_info()[0]
-        logger.log('ERROR', 'xsl parsing error: {}'.format(e), printout=True)
-
     # read all doc source files (*.gz) in part[1..5] directories
     # (total num of files must be 888)
-    doc_files = []
-    for root, dirs, files in os.walk(cfg.PATHS['data-articles']):
-        if not re.match(r"part[1-5]", root.split(os.sep)[-1]):
-            continue
-        for file in files:
-            if not file.endswith('gz'):
-                continue
-            doc_files.append(os.path.join(root, file))
+    # (data-articles may also be an archive of them, see sources.py)
+    doc_files = sources.list_sources(cfg.PATHS['data-articles'],
+                                     r"part[1-5]", 'gz')
     logger.log('INFO', '{} medline documents found from {}'. \
                format(len(doc_files), cfg.PATHS['data-articles']))
 
@@ -57,65 +111,24 @@ def run_import_docs():
     # doc_files.append(
     #     '/home/jiho/research/trec2017/data/articles/doc_sample-long.xml')
 
-    # if skip_files is given, read the list
-    skip_files = []
-    if cfg.skip_files and os.path.exists(cfg.skip_files):
-        with open(cfg.skip_files) as f:
-            skip_files = f.read().splitlines()
-        skip_fh = open(cfg.skip_files, 'a', buffering=1)
-
-    for i, file in enumerate(doc_files):
-        attempts = 3
-        if file in skip_files:
-            logger.log('WARNING',
-                       'file already imported. skipping... {}'.format(file),
-                       printout=True)
-            sys.stdout.flush()
-            continue
-        logger.log('INFO', 'parsing a doc file {}'.format(file))
-
-        # - convert to a solr update xml format
-        _, ext = os.path.splitext(file)
-        if ext == 'gz':
-            doc_trans = transformer(et.parse(gzip.open(file)))
-        else:
-            doc_trans = transformer(et.parse(file))
-
-        # pre-process using metamap [CUI]
-        # doc_trans = utils.extract_cuis(doc_trans)
-
-        # - run update with the converted file
-        url = "http://localhost:8983/solr/articles/update?commit=true"
-        headers = {'content-type': 'text/xml; charset=utf-8'}
-        while attempts > 0:
-            r = None
-            try:
-                r = requests.post(url, data=et.tostring(doc_trans),
-                                  headers=headers)
-            except requests.exceptions.RequestException as e:
-                logger.log('ERROR', 'request exception: {}'.format(e),
-                           die=True, printout=True)
-
-            if r.status_code != 200:
-                attempts -= 1
-                logger.log('ERROR', 'requests error:')
-                logger.log('ERROR', r.text)
-                r.raise_for_status()
-                if attempts < 0:
-                    logger.log('CRITICAL', 'terminating', die=True,
-                               printout=True)
-            else:
-                # - log the results
-                logger.log('INFO', 'importing doc files in progress {}/{}'.
-                           format(i+1, len(doc_files)), printout=True)
-                if cfg.skip_files:
-                    skip_fh.write(file + '\n')
-
-                if cfg.sms and (i+1) % 100 == 0:
-                    logger.sms('importing doc files {}/{}'. \
-                               format(i+1, len(doc_files)))
-
-                break
+    # if skip_files is given, read the journal of imported files
+    skip_files = _read_skip_files()
+    pending = _pending(doc_files, skip_files)
+
+    url = SolrClient().url('a', 'update')
+    if cfg.workers > 1:
+        logger.log('INFO', 'transforming medline files with {} workers'.
+                   format(cfg.workers), printout=True)
+    pipeline = _pipeline(
+        url, _transform_article_file,
+        payload=_payload(),
+        workers=cfg.workers,
+        initializer=_init_xslt_worker,
+        initargs=(cfg.PATHS['xsl-article'],),
+        on_ack=_progress('doc files', doc_files, pending, skip_files,
+                         sms_every=100))
+    # commit once, after the extra documents below
+    pipeline.run(pending, commit=False)
     logger.log('INFO', 'importing medline documents completed', printout=True)
 
     # added for importing extra AACR documents
@@ -130,82 +143,42 @@ def run_import_docs():
     logger.log('INFO', '{} AACR documents found from {}'. \
                format(len(doc_files_extra), path_extra), printout=True)
 
+    pipeline.transform = _transform_aacr_file
+    pipeline.workers = 1
+    pending = _pending(doc_files_extra, skip_files)
+    pipeline.on_ack = _progress('doc files', doc_files_extra, pending,
+                                skip_files, sms_every=1000)
+    pipeline.run(pending)
 
-    # creating document xml in solr add format
-    et_add = et.Element('add')
-    attempts = 3
-    for i, file in enumerate(doc_files_extra):
-        if file in skip_files:
-            logger.log('WARNING',
-                       'file already imported. skipping... {}'.format(file),
-                       printout=True)
-            sys.stdout.flush()
-            continue
-        with open(file) as f:
-            doc_lines = f.read().splitlines()
-
-        logger.log('INFO', 'parsing a doc file {}'.format(file), printout=True)
-        et_doc = et.Element('doc')
-        # use the filename as an id
-        id, _ = os.path.splitext(os.path.basename(file))
-        et_id = et.Element('field', name='id')
-        et_id.text = id
-        et_doc.append(et_id)
-
-        # journal-title
-        title = re.sub(r'^Meeting: ', '', doc_lines[0])
-        if len(title) > 0:
-            et_title = et.Element('field', name='journal-title')
-            et_title.text = title
-            et_doc.append(et_title)
-
-        # subject
-        subject = re.sub(r'^Title: ', '', doc_lines[1])
-        if len(subject) > 0:
-            et_subj = et.Element('field', name='subject')
-            et_subj.text = subject
-            et_doc.append(et_subj)
-
-        # abstract
-        abstract = ''.join(doc_lines[4:])
-        if len(abstract) > 0:
-            et_abs = et.Element('field', name='abstract')
-            et_abs.text = abstract
-            et_doc.append(et_abs)
-        et_add.append(et_doc)
-
-    # - run update with the converted file
-    url = "http://localhost:8983/solr/articles/update?commit=true"
-    headers = {'content-type': 'text/xml; charset=utf-8'}
-    while attempts > 0:
-        r = None
-        try:
-            r = requests.post(url, data=et.tostring(et_add),
-                              headers=headers)
-        except requests.exceptions.RequestException as e:
-            logger.log('ERROR', 'request exception: {}'.format(e),
-                       die=True, printout=True)
-
-        if r.status_code != 200:
-            attempts -= 1
-            logger.log('ERROR', 'requests error:')
-            logger.log('ERROR', r.text)
-            r.raise_for_status()
-            if attempts < 0:
-                logger.log('CRITICAL', 'terminating', die=True,
-                           printout=True)
-        else:
-            # - log the results
-            logger.log('INFO', 'importing doc files in progress {}/{}'.
-                       format(i+1, len(doc_files_extra)), printout=True)
-            if cfg.skip_files:
-                skip_fh.write(file + '\n')
-
-            if cfg.sms and (i+1) % 1000 == 0:
-                logger.sms('importing doc files {}/{}'. \
-                           format(i+1, len(doc_files_extra)))
 
-            break
+def run_enrich_cuis():
+    """add the MetaMap CUIs of the imported medline articles by atomic
+    updates (CUI field); resumable by the CUI journal and the CUI cache,
+    both kept across runs
+    """
+    doc_files = sources.list_sources(cfg.PATHS['data-articles'],
+                                     r"part[1-5]", 'gz')
+    logger.log('INFO', '{} medline documents found from {}'.
+               format(len(doc_files), cfg.PATHS['data-articles']))
+    journal = ImportJournal(cfg.PATHS['cui-journal'])
+    logger.log('INFO', '{} files in the CUI journal [{}]'.
+               format(len(journal), cfg.PATHS['cui-journal']), printout=True)
+
+    pending = _pending(doc_files, journal)
+    if cfg.workers > 1:
+        logger.log('INFO', 'extracting CUIs with {} metamap workers'.
+                   format(cfg.workers), printout=True)
+    pipeline = _pipeline(
+        SolrClient().url('a', 'update'), _transform_cui_file,
+        payload=json_payload,
+        workers=cfg.workers,
+        initializer=_init_cui_worker,
+        initargs=(cfg.PATHS['cui-cache'],),
+        on_ack=_progress('doc files (CUIs)', doc_files, pending, journal,
+                         sms_every=100))
+    pipeline.run(pending)
+    journal.close()
+    logger.log('INFO', 'CUI enrichment completed', printout=True)
 
 
 def run_import_trials():
@@ -215,8 +188,7 @@ def run_import_trials():
     (trials)
     """
 
-    batch = 500
-    url = "http://localhost:8983/solr/trials/update?commit=true"
+    url = SolrClient().url('t', 'update')
 
     # - read xsl file
     if not os.path.isfile(cfg.PATHS['xsl-trial']):
@@ -225,94 +197,227 @@ def run_import_trials():
     else:
         logger.log('DEBUG', 'reading xsl file for clinical trials xml files')
 
-    try:
-        xslt = et.parse(cfg.PATHS['xsl-trial'])
-        transformer = et.XSLT(xslt)
-    except:
-        e = sys.exc_info()[0]
-        logger.log('ERROR', 'xsl parsing error: {}'.format(e), printout=True)
-
     # read all trial source files (*.xml) in trial data sub-directories
     # (total num of files must be 241006)
-    trial_files = []
-    for root, dirs, files in os.walk(cfg.PATHS['data-trials']):
-        if not re.match(r"\d+", root.split(os.sep)[-1]):
-            continue
-        for file in files:
-            if not file.endswith('xml'):
-                continue
-            trial_files.append(os.path.join(root, file))
+    # (data-trials may also be an archive of them, see sources.py)
+    trial_files = sources.list_sources(cfg.PATHS['data-trials'], r"\d+",
+                                       'xml')
     logger.log('INFO', '{} trials found from {}'. \
                format(len(trial_files), cfg.PATHS['data-trials']))
 
-    # if skip_files is given, read the list
-    skip_files = []
-    if cfg.skip_files and os.path.isfile(cfg.skip_files):
-        with open(cfg.skip_files) as f:
-            skip_files = f.read().splitlines()
-        skip_fh = open(cfg.skip_files, 'a', buffering=1)
-
-    docs_collated = 0
-    skipped_files = 0
-    completed_files = 0
-    for i, file in enumerate(trial_files):
-        attempts = 3
-        if file in skip_files:
-            skipped_files += 1
-            if skipped_files % 1000 == 0:
-                logger.log('INFO', 'skipping files [{}/{}]'. \
-                           format(skipped_files, len(skip_files)))
-            continue
-        logger.log('INFO', 'parsing a trial file {}'.format(file))
-
-        if docs_collated == 0:
-            req = et.Element('add')
-
-        # - transform trial xml to solr update format
-        trial_trans = transformer(et.parse(file))
-        # - pre-indexing nlp process
-        utils.age_normalize(trial_trans)
-        if docs_collated < batch:
-            req.append(trial_trans.getroot())
-            docs_collated += 1
-
-        # - run update, if docs_collated reached batch or end of files
-        if docs_collated == batch or i == len(trial_files)-1:
-            docs_collated = 0
-            headers = {'content-type': 'text/xml; charset=utf-8'}
-
-            while attempts > 0:
-                try:
-                    r = requests.post(url, data=et.tostring(req),
-                                     headers=headers)
-                except requests.exceptions.RequestException as e:
-                    logger.log('ERROR', 'request exception: {}'.format(e))
-                    logger.log('ERROR', r, die=True, printout=True)
-
-                if r.status_code != 200:
-                    attempts -= 1
-                    logger.log('ERROR', r.text)
-                    logger.log('ERROR', 'data: \n' + str(et.tostring(req)))
-                    r.raise_for_status()
-                    if attempts < 0:
-                        logger.log('CRITICAL', 'terminating', die=True,
-                                   printout=True)
-                else:
-                    completed_files += 1
-                    # - log the results
-                    logger.log('INFO',
-                               'importing trial files in progress {}/{}'. \
-                               format(i+1, len(trial_files)), printout=True)
-                    if cfg.skip_files:
-                        skip_fh.write(file + '\n')
-
-                    if cfg.sms and completed_files % 5000 == 0:
-                        logger.sms('importing trial files {}/{}'. \
-                                   format(i+1, len(trial_files)))
-                    break
+    if cfg.incremental:
+        # compare with the fingerprint index of the previous import, and
+        # delete trials that disappeared before posting new/changed ones
+        skip_files = ImportJournal(cfg.PATHS['trials-index'],
+                                   fingerprint=content_fingerprint)
+        trial_files, deleted, gone_files = \
+            _trials_delta(trial_files, skip_files)
+        _delete_ids(url, deleted)
+        skip_files.forget(gone_files)
+        pending = trial_files  # the delta is already computed
+    else:
+        # if skip_files is given, read the journal of imported files
+        skip_files = _read_skip_files()
+        pending = _pending(trial_files, skip_files)
+
+    if cfg.CONF_IMPORT['trial_extractor'] == 'direct':
+        extractor = dict(transform=_transform_trial_direct,
+                         payload=_payload())
+    else:
+        extractor = dict(transform=_transform_trial_file,
+                         payload=xml_payload,
+                         initializer=_init_xslt_worker,
+                         initargs=(cfg.PATHS['xsl-trial'],))
+    pipeline = _pipeline(
+        url,
+        workers=cfg.workers,
+        on_ack=_progress('trial files', trial_files, pending, skip_files,
+                         sms_every=5000, log_every=500),
+        **extractor)
+    pipeline.run(pending)
+    if cfg.incremental:
+        skip_files.compact()
     logger.log('INFO', 'importing trials completed', printout=True)
 
 
+def run_bench_trials(limit=1000):
+    """compare the direct trial extractor with the xslt path (trials.xsl and
+    utils.age_normalize): check that both produce the same fields for the
+    first trial files, and measure docs/sec of each
+
+    :param limit: number of trial files to use
+    :return: number of documents with different fields
+    """
+    import time
+
+    trial_files = sources.list_sources(cfg.PATHS['data-trials'], r"\d+",
+                                       'xml')[:limit]
+    # - equivalence
+    mismatches = compare_trial_fields(trial_files)
+    logger.log('INFO', '{} of {} trials have different fields'.
+               format(mismatches, len(trial_files)), printout=True)
+
+    # - docs/sec
+    for name, func in [('xslt', _transform_trial_file),
+                       ('direct', transform.iter_trial_docs)]:
+        t0 = time.time()
+        size = sum(len(d) for file in trial_files for d in func(file))
+        elapsed = time.time() - t0
+        logger.log('INFO', '{:>6}: {:.1f} docs/sec, {} bytes'.
+                   format(name, len(trial_files) / elapsed, size),
+                   printout=True)
+    return mismatches
+
+
+def compare_medline_fields(doc_files):
+    """compare the fields of the streaming medline extractor with the ones
+    of articles.xsl, article by article and field by field
+
+    :param doc_files: medline xml sources (optionally gzipped)
+    :return: number of articles with different fields, number of articles
+    """
+    xslt = et.XSLT(et.parse(cfg.PATHS['xsl-article']))
+    mismatches, count = 0, 0
+    for file in doc_files:
+        with sources.open_source(file) as f:
+            dom = xslt(et.parse(f))
+        expected = [[(f.get('name'), f.text or '') for f in doc]
+                    for doc in dom.getroot()]
+        actual = [[(name, str(value)) for name, value in fields]
+                  for fields in transform.iter_medline_fields(file)]
+        for i in range(max(len(expected), len(actual))):
+            exp = expected[i] if i < len(expected) else None
+            act = actual[i] if i < len(actual) else None
+            if exp != act:
+                mismatches += 1
+                logger.log('ERROR', 'fields of article #{} differ in {}:\n{}'
+                           '\n{}'.format(i+1, file, exp, act), printout=True)
+        count += max(len(expected), len(actual))
+    return mismatches, count
+
+
+def compare_trial_fields(trial_files):
+    """compare the fields of the direct trial extractor with the ones of the
+    xslt path (trials.xsl and utils.age_normalize), field by field
+
+    :param trial_files: trial xml files
+    :return: number of trials with different fields
+    """
+    _init_xslt_worker(cfg.PATHS['xsl-trial'])
+    mismatches = 0
+    for file in trial_files:
+        dom = _transformer(et.parse(file))
+        utils.age_normalize(dom)
+        # the text that the built-in template copies of unknown
+        # study_design_info children is not a field (solr ignores it)
+        expected = [(f.get('name'), f.text or '') for f in dom.getroot()]
+        fields = transform.trial_fields(et.parse(file).getroot())
+        actual = [(name, str(value)) for name, value in fields]
+        if expected != actual:
+            mismatches += 1
+            logger.log('ERROR', 'fields differ in {}:\n{}\n{}'.
+                       format(file, expected, actual), printout=True)
+    return mismatches
+
+
+def run_bench_formats(limit=1000):
+    """compare the update formats: xml documents by the xslt files against
+    json documents by the direct extractors, for the first trial files and
+    the first medline file; payload bytes (raw and gzipped) and docs/sec
+
+    :param limit: number of trial files to use
+    :return: dict of (source, format) -> (docs, bytes, gzipped bytes, secs)
+    """
+    import gzip
+    import time
+    from Trec2017pm.pipeline import json_payload, xml_payload
+
+    trial_files = sources.list_sources(cfg.PATHS['data-trials'], r"\d+",
+                                       'xml')[:limit]
+    doc_files = sources.list_sources(cfg.PATHS['data-articles'],
+                                     r"part[1-5]", 'gz')[:1]
+
+    xslt_article = et.XSLT(et.parse(cfg.PATHS['xsl-article']))
+    xslt_trial = et.XSLT(et.parse(cfg.PATHS['xsl-trial']))
+
+    def articles_xslt(file):
+        with sources.open_source(file) as f:
+            dom = xslt_article(et.parse(f))
+        return [et.tostring(d) for d in dom.getroot()]
+
+    def trials_xslt(file):
+        with sources.open_source(file) as f:
+            dom = utils.age_normalize(xslt_trial(et.parse(f)))
+        return [et.tostring(dom.getroot())]
+
+    results = dict()
+    for src, files, funcs in [
+            ('trials', trial_files,
+             [('xml', trials_xslt, xml_payload),
+              ('json', transform.iter_trial_docs, json_payload)]),
+            ('medline', doc_files,
+             [('xml', articles_xslt, xml_payload),
+              ('json', transform.iter_medline_docs, json_payload)])]:
+        for fmt, func, payload in funcs:
+            t0 = time.time()
+            docs = [d for file in files for d in func(file)]
+            data = payload(docs)
+            elapsed = time.time() - t0
+            size_gz = len(gzip.compress(data, compresslevel=1))
+            results[(src, fmt)] = (len(docs), len(data), size_gz, elapsed)
+            logger.log('INFO', '{:>7} {:>4}: {:.1f} docs/sec, {} bytes, {} '
+                               'bytes gzipped'.
+                       format(src, fmt, len(docs) / max(elapsed, 1e-9),
+                              len(data), size_gz), printout=True)
+    return results
+
+
+def _trials_delta(trial_files, index):
+    """split the trial files into the ones to (re-)import, and the ids of the
+    trials removed since the last import
+
+    :param trial_files: current trial files
+    :param index: ImportJournal of the previously imported trial files
+    :return: list of new or changed files, list of ids to delete, and list
+        of the indexed files that are gone
+    """
+    current = set(trial_files)
+    new_files = [f for f in trial_files if f not in index.entries]
+    changed_files = [f for f in trial_files
+                     if f in index.entries and f not in index]
+    gone_files = [f for f in index.entries if f not in current]
+
+    # trials are identified by their file names (nct_id); a trial moved to
+    # another directory must not be deleted
+    current_ids = set(_trial_id(f) for f in trial_files)
+    deleted = [_trial_id(f) for f in gone_files
+               if _trial_id(f) not in current_ids]
+    logger.log('INFO', 'trials delta: {} new, {} changed, {} deleted, {} '
+                       'unchanged'.format(len(new_files), len(changed_files),
+                                          len(deleted),
+                                          len(trial_files) - len(new_files) -
+                                          len(changed_files)),
+               printout=True)
+    return new_files + changed_files, deleted, gone_files
+
+
+def _trial_id(file):
+    return os.path.splitext(os.path.basename(file))[0]
+
+
+def _delete_ids(url, ids, batch=1000):
+    """delete documents by id"""
+    headers = {'content-type': 'text/xml; charset=utf-8'}
+    for i in range(0, len(ids), batch):
+        req = et.Element('delete')
+        for id in ids[i:i+batch]:
+            et.SubElement(req, 'id').text = id
+        SolrClient().update(url, et.tostring(req), headers)
+    if len(ids) > 0:
+        logger.log('INFO', '{} documents deleted'.format(len(ids)),
+                   printout=True)
+
+
 def run_import_extra():
     """
     mti resulting list format (just the facts):
@@ -368,206 +473,495 @@ def run_import_extra():
                 cnt[2] += 1
         logger.log('INFO', "listed files: AACR({}), ASCO({}), other({})"
                    "".format(cnt[0], cnt[1], cnt[2]), printout=True)
-    # if skip_files is given, rea the list
-    skip_files = []
-    if cfg.skip_files and os.path.exists(cfg.skip_files):
-        with open(cfg.skip_files) as f:
-            skip_files = f.read().splitlines()
-        skip_fh = open(cfg.skip_files, 'a', buffering=1)
-    else:
+    # if skip_files is given, read the journal of imported files
+    skip_files = _read_skip_files()
+    if not cfg.skip_files:
         print(cfg.skip_files, len(skip_files))
         return
+    pending = _pending(doc_files, skip_files)
 
     # iterate doc files
-    num_batch = 1000
-    collated = 0
-    et_add = None
-    attempts = 3
-    url = "http://localhost:8983/solr/articles/update?commit=true"
-    headers = {'content-type': 'text/xml; charset=utf-8'}
-
-    for i, file in enumerate(doc_files):
-        if collated == 0:
-            et_add = et.Element('add')
-        if file in skip_files:
-            logger.log('WARNING',
-                       'file already imported. skipping... {}'.format(file),
-                       printout=True)
-            sys.stdout.flush()
+    url = SolrClient().url('a', 'update')
+    pipeline = _pipeline(
+        url, _transform_extra_file,
+        payload=_payload(),
+        workers=cfg.workers,
+        initializer=_init_extra_worker,
+        initargs=(newMesh,),
+        on_ack=_progress('doc files', doc_files, pending, skip_files,
+                         sms_every=10000, log_every=1000))
+    pipeline.run(pending)
+
+
+def _pipeline(url, transform, **kwargs):
+    """create an import pipeline with the settings in CONF_IMPORT"""
+    conf = cfg.CONF_IMPORT
+    return ImportPipeline(url, transform, SolrClient().update,
+                          posters=conf['posters'],
+                          queue_depth=conf['queue_depth'],
+                          commit=conf['commit'],
+                          commit_within=conf['commit_within'],
+                          commit_every=conf['commit_every'],
+                          optimize=conf['optimize'],
+                          batch=conf['batch_docs_max'],
+                          batch_bytes=conf['batch_bytes'],
+                          batch_bytes_min=conf['batch_bytes_min'],
+                          batch_bytes_max=conf['batch_bytes_max'],
+                          latency=conf['latency'],
+                          gzip=conf['gzip'],
+                          **kwargs)
+
+
+def _payload():
+    """payload function of the update format (CONF_IMPORT['format'])"""
+    return json_payload if cfg.CONF_IMPORT['format'] == 'json' \
+        else xml_payload
+
+
+def _read_skip_files():
+    """read the journal of already imported files (cfg.skip_files), where
+    newly imported files are recorded; an empty set if not given"""
+    if cfg.skip_files:
+        journal = ImportJournal(cfg.skip_files)
+        logger.log('INFO', '{} files in the import journal [{}]'.
+                   format(len(journal), cfg.skip_files), printout=True)
+        return journal
+    return set()
+
+
+def _pending(files, skip_files):
+    """files not imported yet; each file is looked up in the journal (and
+    fingerprinted) once, for both the pipeline and its progress"""
+    pending = [f for f in files if f not in skip_files]
+    if len(pending) < len(files):
+        logger.log('WARNING', '{} files already imported. skipping...'.
+                   format(len(files) - len(pending)), printout=True)
+    return pending
+
+
+def _progress(name, files, pending, skip_files, sms_every=100, log_every=1):
+    """build an on_ack callback of the import pipeline, which records the
+    imported files in the journal and reports the progress
+
+    :param files: all the source files
+    :param pending: the files to import (_pending)
+    """
+    state = {'done': len(files) - len(pending)}
+
+    def on_ack(acked):
+        if isinstance(skip_files, ImportJournal):
+            skip_files.record(acked)
+        prev = state['done']
+        state['done'] += len(acked)
+        done = state['done']
+        # - log the results
+        logger.log('INFO', 'importing {} in progress {}/{}'.
+                   format(name, done, len(files)),
+                   printout=(done // log_every > prev // log_every or
+                             done == len(files)))
+        if cfg.sms and done // sms_every > prev // sms_every:
+            logger.sms('importing {} {}/{}'.format(name, done, len(files)))
+    return on_ack
+
+
+# xslt transformer of the current (worker) process; compiled once per process
+_transformer = None
+# meshHeadings of the extra documents (run_import_extra)
+_extra_mesh = None
+# CUI cache of the current (worker) process (run_enrich_cuis)
+_cui_cache = None
+
+
+def _init_xslt_worker(xsl_file):
+    """compile the xslt once in each worker process"""
+    global _transformer
+    _transformer = et.XSLT(et.parse(xsl_file))
+
+
+def _init_extra_worker(new_mesh):
+    global _extra_mesh
+    _extra_mesh = new_mesh
+
+
+def _init_cui_worker(cache_file):
+    """open the CUI cache in each worker process"""
+    global _cui_cache
+    _cui_cache = enrich.CuiCache(cache_file)
+
+
+def _transform_cui_file(file):
+    """build atomic updates setting the CUIs of the articles in a medline
+    file; MetaMap is run only for the texts missing in the cache"""
+    texts = []  # (pmid, text hash)
+    missing = dict()  # text hash -> text
+    for fields in transform.iter_medline_fields(file):
+        pmid = fields[0][1]
+        text = ' '.join(v for name, v in fields
+                        if name in enrich.CUI_SOURCE_FIELDS and v)
+        if len(text) == 0:
             continue
+        h = enrich.text_hash(text)
+        texts.append((pmid, h))
+        missing[h] = text
+
+    cuis = _cui_cache.get_many(missing.keys())
+    for h in cuis:
+        del missing[h]
+    if len(missing) > 0:
+        extracted = enrich.extract_cuis(metamap.get_instance(), missing,
+                                        cfg.CONF_IMPORT['cui_batch'])
+        _cui_cache.put_many(extracted)
+        cuis.update(extracted)
+
+    return [json.dumps({'id': pmid, 'CUI': {'set': cuis[h]}}).encode()
+            for pmid, h in texts if len(cuis[h]) > 0]
+
+
+def _transform_article_file(file):
+    """transform a medline file into serialized solr documents
+
+    :param file: medline xml source (optionally gzipped)
+    :return: iterable of serialized documents (CONF_IMPORT['format'])
+    """
+    # streaming path: bounded memory regardless of the file size
+    fmt = cfg.CONF_IMPORT['format']
+    if cfg.stream or fmt != 'xml':
+        return transform.iter_medline_docs(file, fmt)
 
-        logger.log('INFO', 'parsing a doc file {}'.format(file), printout=True)
-        et_doc = et.Element('doc')
-        with open(file) as f:
-            # use the filename as an id
-            filename, ext = os.path.splitext(file)
-            id = filename.split(os.sep)[-1]
-            et_id = et.Element('field', name='id')
-            et_id.text = id
-            et_doc.append(et_id)
-
-            doc = f.read()
-            doc = ''.join([i if ord(i) < 128 else ' ' for i in doc])
-            doc = doc.splitlines()
-            title, subject = doc[:2]
-            # journal-title
-            title = re.sub(r'^Meeting: ', '', doc[0])
-            if len(title) > 0:
-                et_title = et.Element('field', name='journal-title')
-                et_title.text = title
-                et_doc.append(et_title)
-            # subject
-            subject = re.sub(r'^Title: ', '', subject)
-            if len(subject) > 0:
-                et_subj = et.Element('field', name='subject')
-                et_subj.text = subject
-                et_doc.append(et_subj)
-            # abstract
-            abstract = ''.join(doc[4:])
-            if len(abstract) > 0:
-                et_abs = et.Element('field', name='abstract')
-                et_abs.text = abstract
-                et_doc.append(et_abs)
-            # add corresponding meshHeadings
-            if id in newMesh:
-                for mesh in newMesh[id]:
-                    et_mesh = et.Element('field', name='meshHeading')
-                    et_mesh.text = mesh
-                    et_doc.append(et_mesh)
-
-        et_add.append(et_doc)
-        collated += 1
-
-        # run update with the collated doc files
-        if collated >= num_batch or i >= len(doc_files) - 1:
-            print("it.{} {} docuemtns will be updated"
-                  "".format(i, len(et_add)))
-            while attempts > 0:
-                r = None
-                try:
-                    r = requests.post(url, data=et.tostring(et_add),
-                                      headers=headers)
-                except requests.exceptions.RequestException as e:
-                    logger.log('ERROR', 'request exception: {}'.format(e),
-                               die=True, printout=True)
-
-                if r.status_code != 200:
-                    attempts -= 1
-                    logger.log('ERROR', 'requests error:')
-                    logger.log('ERROR', r.text)
-                    r.raise_for_status()
-                    if attempts < 0:
-                        logger.log('CRITICAL', 'terminating', die=True,
-                                   printout=True)
-                else:
-                    # - log the results
-                    logger.log('INFO', 'importing doc files in progress {}/{}'.
-                               format(i + 1, len(doc_files)), printout=True)
-                    if cfg.skip_files:
-                        skip_fh.write(file + '\n')
-
-                    if cfg.sms and (i + 1) % 10000 == 0:
-                        logger.sms('importing doc files {}/{}'. \
-                                   format(i + 1, len(doc_files)))
-                    collated = 0
-                    break
+    with sources.open_source(file) as f:
+        doc_trans = _transformer(et.parse(f))
+
+    # CUIs are added afterwards by run_enrich_cuis (atomic updates)
+    return [et.tostring(d) for d in doc_trans.getroot()]
+
+
+def _transform_trial_file(file):
+    """transform a trial xml file into a serialized solr document (xslt)"""
+    # - transform trial xml to solr update format
+    with sources.open_source(file) as f:
+        trial_trans = _transformer(et.parse(f))
+    # - pre-indexing nlp process
+    utils.age_normalize(trial_trans)
+    return [et.tostring(trial_trans.getroot())]
+
+
+def _transform_trial_direct(file):
+    """transform a trial xml file by the direct extractor"""
+    return list(transform.iter_trial_docs(file, cfg.CONF_IMPORT['format']))
+
+
+def _transform_aacr_file(file):
+    """build a solr document from an AACR abstract (text file)"""
+    with open(file) as f:
+        doc_lines = f.read().splitlines()
+
+    # use the filename as an id
+    id, _ = os.path.splitext(os.path.basename(file))
+    fields = [('id', id)]
+    fields.extend(_abstract_fields(doc_lines))
+    return [transform.SERIALIZERS[cfg.CONF_IMPORT['format']](fields)]
+
+
+def _transform_extra_file(file):
+    """build a solr document from an extra abstract (AACR/ASCO) along with
+    its MTI meshHeadings"""
+    with open(file) as f:
+        # use the filename as an id
+        filename, ext = os.path.splitext(file)
+        id = filename.split(os.sep)[-1]
+        fields = [('id', id)]
+
+        doc = f.read()
+        doc = ''.join([i if ord(i) < 128 else ' ' for i in doc])
+        fields.extend(_abstract_fields(doc.splitlines()))
+        # add corresponding meshHeadings
+        if id in _extra_mesh:
+            for mesh in _extra_mesh[id]:
+                fields.append(('meshHeading', mesh))
+    return [transform.SERIALIZERS[cfg.CONF_IMPORT['format']](fields)]
+
+
+def _abstract_fields(doc_lines):
+    """journal-title, subject and abstract of an extra abstract (lines of the
+    text file); empty fields are left out"""
+    fields = []
+    # journal-title
+    title = re.sub(r'^Meeting: ', '', doc_lines[0])
+    if len(title) > 0:
+        fields.append(('journal-title', title))
+    # subject
+    subject = re.sub(r'^Title: ', '', doc_lines[1])
+    if len(subject) > 0:
+        fields.append(('subject', subject))
+    # abstract
+    abstract = ''.join(doc_lines[4:])
+    if len(abstract) > 0:
+        fields.append(('abstract', abstract))
+    return fields
 
 
 def run_queries(queries, res_path, target, q_no=None, save_queries=True):
+    """run the queries of the topics on the target cores and write the
+    ranked lists for trec_eval
+
+    With CONF_SOLR['query_workers'] > 1, the topics (and both cores for
+    target 'b') are queried concurrently; the result files are still written
+    in topic and rank order.
+    """
     assert target in ['a', 't', 'b'], "target source is undefined"
 
-    if cfg.CONF_SOLR['enable_conj_uprank']:
+    # single pass conjunctive up-rank (utils.parse_topics_conj) gives the
+    # final ranking
+    single_pass = any('conj' in q for q in queries)
+    if cfg.CONF_SOLR['enable_conj_uprank'] and not single_pass:
         top_docs_a = os.path.join(res_path, 'top_articles-cjt.out')
         top_docs_t = os.path.join(res_path, 'top_trials-cjt.out')
     else:
         top_docs_a = os.path.join(res_path, 'top_articles.out')
         top_docs_t = os.path.join(res_path, 'top_trials.out')
 
+    # (target, topic index, query) in the order of the result files
+    jobs = []
     if target in ['a', 'b']:
-        with open(top_docs_a, 'w') as top_docs:
-            if q_no is not None and len(q_no) == len(queries):
-                q_no = [x - 1 for x in q_no]
-                z_queries = zip(q_no, queries)
-            else:
-                z_queries = zip(range(len(queries)), queries)
-            for i, query in z_queries:
-                # if cfg.topic and i+1 != int(cfg.topic):
-                #     print('skipping', i, cfg.topic)
-                #     continue
-
-                print("querying topic #{} on articles".format(i+1))
-                sys.stdout.flush()
-                ranked_docs = []
-                res = _query(query, target='a')
-                for rank, doc in enumerate(res['response']['docs']):
-                    ranked_docs.append(doc['id'])
-                    # write ranked list for trec_eval
-                    topic = int(cfg.topic) if cfg.topic else i+1
-                    top_docs.write("{} Q0 {} {} {} run_name\n".
-                                   format(topic, doc['id'], rank, doc['score']))
-                # save query per topic
-                if save_queries:
-                    if cfg.CONF_SOLR['enable_conj_uprank']:
-                        qfile = os.path.join(res_path, 'a{}-cjt.query'.format(i+1))
-                    else:
-                        qfile = os.path.join(res_path, 'a{}.query'.format(i+1))
-                    with open(qfile, 'w') as qf:
-                        qf.write(query['query'] + "\n")
-        logger.log('INFO', "result file [{}] saved".format(top_docs_a),
-                   printout=True)
+        if q_no is not None and len(q_no) == len(queries):
+            q_no = [x - 1 for x in q_no]
+            z_queries = zip(q_no, queries)
+        else:
+            z_queries = zip(range(len(queries)), queries)
+        jobs.extend(('a', i, query) for i, query in z_queries)
     if target in ['t', 'b']:
-        with open(top_docs_t, 'w') as top_docs:
-            for i, query in enumerate(queries):
-                # if cfg.topic and i+1 != int(cfg.topic):
-                #     continue
-
-                ranked_docs = []
-                print("querying topic #{} on trials".format(i+1))
-                res = _query(query, target='t')
-                for rank, doc in enumerate(res['response']['docs']):
-                    ranked_docs.append(doc['id'])
-                    # write ranked list for trec_eval
-                    topic = int(cfg.topic) if cfg.topic else i+1
-                    top_docs.write("{} Q0 {} {} {} run_name\n".
-                                   format(topic, doc['id'], rank, doc['score']))
-                if save_queries:
-                    # save query per topic
-                    if cfg.CONF_SOLR['enable_conj_uprank']:
-                        qfile = os.path.join(res_path,
-                                             't{}-cjt.query'.format(i+1))
-                    else:
-                        qfile = os.path.join(res_path,
-                                             't{}.query'.format(i+1))
+        jobs.extend(('t', i, query) for i, query in enumerate(queries))
+
+    def run(job):
+        t, i, query = job
+        print("querying topic #{} on {}".format(
+            i+1, 'articles' if t == 'a' else 'trials'))
+        sys.stdout.flush()
+        if 'conj' in query:
+            return _query_conj(query, target=t)
+        return _query(query, target=t)
+
+    top_files = {'a': top_docs_a, 't': top_docs_t}
+    targets = sorted(set(t for t, _, _ in jobs))
+    if cfg.CONF_SOLR['cache']:
+        # look up the index versions again; the cores may have changed
+        _index_versions.clear()
+        rescache.get_cache().reset_counters()
+    workers = cfg.CONF_SOLR['query_workers']
+    executor = ThreadPoolExecutor(workers) if workers > 1 else None
+    outs = {t: open(top_files[t], 'w') for t in targets}
+    try:
+        # executor.map yields the results in the order of the jobs
+        results = executor.map(run, jobs) if executor else map(run, jobs)
+        for (t, i, query), ranked in zip(jobs, results):
+            # write ranked list for trec_eval
+            topic = int(cfg.topic) if cfg.topic else i+1
+            for rank, (doc_id, score) in enumerate(ranked):
+                outs[t].write("{} Q0 {} {} {} run_name\n".
+                              format(topic, doc_id, rank, score))
+            # save query per topic
+            if save_queries:
+                suffix = '-cjt' if cfg.CONF_SOLR['enable_conj_uprank'] and \
+                    not single_pass else ''
+                qfile = os.path.join(res_path,
+                                     '{}{}{}.query'.format(t, i+1, suffix))
+                with open(qfile, 'w') as qf:
+                    qf.write(query['query'] + "\n")
+                if 'conj' in query:
+                    qfile = os.path.join(res_path,
+                                         '{}{}-cjt.query'.format(t, i+1))
                     with open(qfile, 'w') as qf:
-                        qf.write(query['query'] + "\n")
-        logger.log('INFO', "result file [{}] saved".format(top_docs_t),
+                        qf.write(query['conj'] + "\n")
+    finally:
+        for out in outs.values():
+            out.close()
+        if executor is not None:
+            executor.shutdown()
+    for t in targets:
+        logger.log('INFO', "result file [{}] saved".format(top_files[t]),
                    printout=True)
+    if cfg.CONF_SOLR['cache']:
+        cache = rescache.get_cache()
+        logger.log('INFO', "response cache: {} hits, {} misses".format(
+            cache.hits, cache.misses), printout=True)
 
 
-def _query(t, target):
-    if target == 'a':
-        url = "http://localhost:8983/solr/articles/query?"
-    elif target == 't':
-        url = "http://localhost:8983/solr/trials/query?"
+def _query(t, target, fields=None, rows=None):
+    """run a query for its ranking only
 
+    Only the fields of CONF_SOLR['fl'] (id and score) are returned, in the
+    compact format of the response writer CONF_SOLR['wt'] ('csv' or 'json');
+    the stored fields of the documents can be fetched later (fetch_docs).
+    A failed query raises RuntimeError rather than returning no ranking.
+
+    :param fields: list of (name, function) of the pseudo-fields returned
+        after id and score
+    :param rows: number of documents; CONF_SOLR['rows'] if None
+    :return: list of (id, score, *fields), by rank
+    """
+    params = {'wt': cfg.CONF_SOLR.get('wt', 'json')}
     if 'fl' in cfg.CONF_SOLR:
-        url += 'fl=' + cfg.CONF_SOLR['fl'] + '&'
+        params['fl'] = cfg.CONF_SOLR['fl']
+    if fields:
+        params['fl'] = ','.join(['id', 'score'] + ['{}:{}'.format(n, f)
+                                                   for n, f in fields])
+    names = [n for n, _ in fields or []]
     if 'rows' in cfg.CONF_SOLR:
-        url += 'rows=' + str(cfg.CONF_SOLR['rows']) + '&'
-    headers = {
-        'content-type': 'application/json',
-        'Accept-Charset': 'UTF-8'}
+        params['rows'] = cfg.CONF_SOLR['rows']
+    if rows is not None:
+        params['rows'] = rows
+    if params['wt'] == 'csv':
+        params['csv.header'] = 'false'
+
+    cache, key = None, None
+    if cfg.CONF_SOLR['cache']:
+        version = _index_version(target)
+        if version is not None:
+            cache = rescache.get_cache()
+            key = rescache.response_key(cfg.CONF_SOLR['cores'][target],
+                                        version, t, params)
+            text = cache.get(key)
+            if text is not None:
+                return _parse_ranking(text, params['wt'], names)
     try:
-        r = requests.post(url, data=json.dumps(t), headers=headers)
+        r = SolrClient().query(target, t, params)
     except requests.exceptions.RequestException as e:
         logger.log('ERROR', 'request exception: {}'.format(e))
-        logger.log('ERROR', r, die=True, printout=True)
+        logger.log('ERROR', t, die=True, printout=True)
+        raise
 
     if r.status_code != 200:
         logger.log('ERROR', t, printout=True)
-    else:
-        logger.log('INFO', 'query processed: {}'.format(t))
-        res = json.loads(r.text)
-        # pp.pprint(res)
-        return res
+        raise RuntimeError('query on core {} failed: {} {}'.format(
+            cfg.CONF_SOLR['cores'][target], r.status_code, r.text))
+    logger.log('INFO', 'query processed: {}'.format(t))
+    r.encoding = 'utf-8'
+    if cache is not None:
+        cache.put(key, cfg.CONF_SOLR['cores'][target],
+                  _index_versions[target], r.text)
+    return _parse_ranking(r.text, params['wt'], names)
 
+
+def _index_version(target):
+    """version of the index of a core, looked up once per run; None if it
+    is not available (the response cache is not used then)
+
+    Cached responses of the other versions of the index are dropped.
+    """
+    if target not in _index_versions:
+        client = SolrClient()
+        version = None
+        try:
+            r = client.session.get(client.url(target, 'admin/luke'),
+                                   params={'numTerms': 0, 'wt': 'json'},
+                                   timeout=client.timeout)
+            if r.status_code == 200:
+                version = str(json.loads(r.text)['index']['version'])
+        except (requests.exceptions.RequestException, ValueError,
+                KeyError) as e:
+            logger.log('WARNING', 'index version: {}'.format(e))
+        if version is not None and cfg.CONF_SOLR['cache']:
+            dropped = rescache.get_cache().invalidate(
+                cfg.CONF_SOLR['cores'][target], version)
+            if dropped > 0:
+                logger.log('INFO', 'response cache: {} responses of older '
+                           'indexes dropped'.format(dropped))
+        _index_versions[target] = version
+    return _index_versions[target]
+
+
+def _parse_ranking(text, wt, names=()):
+    """(id, score, *values of the pseudo-fields names) of the documents of a
+    query response"""
+    if wt == 'csv':
+        # one "id,score[,field...]" line per document (ids have no commas)
+        ranking = []
+        for line in text.splitlines():
+            if line:
+                values = line.rsplit(',', 1 + len(names))
+                ranking.append(tuple([values[0]] +
+                                     [float(v) for v in values[1:]]))
+        return ranking
+    res = json.loads(text)
+    return [tuple([doc['id'], doc['score']] + [doc[n] for n in names])
+            for doc in res['response']['docs']]
+
+
+def _query_conj(query, target):
+    """conjunctive up-rank in a single request: the default query
+    (query['query']) retrieves the documents, and the ones matching the
+    conjunctive query (query['conj']) are ranked first, by their conjunctive
+    score; the others follow by their default score.
+
+    Scores are those of runner.merge_ranked_list: the conjunctive score plus
+    the top default score of the topic, or the default score.
+
+    :return: list of (id, score), by rank
+    """
+    body = {'query': query['query'],
+            'sort': 'query($cjt,0) desc,score desc',
+            'params': {'cjt': query['conj']}}
+    ranked = _query(body, target, fields=[('cjt', 'query($cjt,0)')])
+    top = max([score for _, score, _ in ranked] or [0.])
+    return [(doc_id, cjt + top if cjt > 0 else score)
+            for doc_id, score, cjt in ranked]
+
+
+def extract_features(templates, target='a', rows=None):
+    """clause scores of the candidate documents of weighted query templates
+    (see rescore.py)
+
+    The score of a clause is the score of its template with the weight of
+    the clause set to 1 and the others to 0, returned as a pseudo-field. The
+    candidates of a topic are the top documents by each of the clauses and
+    by the template with all weights 1.
+
+    :param templates: dict of topic no -> query template (<WT1>..<WT8>)
+    :param rows: candidates per clause; CONF_SOLR['rows'] if None
+    :return: rescore.FeatureCache
+    """
+    from Trec2017pm import rescore
+    n = len(rescore.CLAUSES)
+    fields = [('f{}'.format(k+1), 'query($w{},0)'.format(k+1))
+              for k in range(n)]
+    features = dict()
+    for topic, template in sorted(templates.items()):
+        logger.log('INFO', 'extracting clause scores of topic #{}'.
+                   format(topic), printout=True)
+        params = {'w{}'.format(k+1): rescore.fill_template(
+            template, [1. if j == k else 0. for j in range(n)])
+            for k in range(n)}
+        docs = dict()
+        for k in [None] + list(range(n)):
+            body = {'query': rescore.fill_template(template, [1.] * n),
+                    'params': params}
+            if k is not None:
+                body['sort'] = 'query($w{},0) desc'.format(k+1)
+            for doc in _query(body, target, fields=fields, rows=rows):
+                docs[doc[0]] = doc[2:]
+        ids = sorted(docs)
+        features[topic] = (ids, [docs[i] for i in ids])
+    return rescore.FeatureCache(features, version=_index_version(target))
+
+
+def fetch_docs(target, ids, fl='*', batch=100):
+    """stored fields of documents, for the few documents of a ranking that
+    are actually inspected (real-time get handler)
+
+    :param target: 'a' or 't'
+    :param ids: document ids
+    :param fl: fields to return
+    :return: dict of id -> document, for the ids found
+    """
+    ids = list(ids)
+    client = SolrClient()
+    docs = dict()
+    for i in range(0, len(ids), batch):
+        r = client.session.get(client.url(target, 'get'),
+                               params={'ids': ','.join(ids[i:i+batch]),
+                                       'fl': fl, 'wt': 'json'},
+                               timeout=client.timeout)
+        r.raise_for_status()
+        for doc in json.loads(r.text)['response']['docs']:
+            docs[doc['id']] = doc
+    return docs
@@ -0,0 +1,182 @@
+""" source files of the importers, on disk or inside distribution archives
+
+A source is either a file path, or a member of a zip/tar(.gz) archive
+written as "<archive>!<member>" (ex. AllPublicXML.zip!NCT0000xxxx/
+NCT00000102.xml), so that the trial and medline files can be imported
+without unpacking them.
+
+Members are read by random access through a member index: the central
+directory for zip files, and an index of data offsets for tar files built
+by one scan and saved next to the archive (<archive>.idx). Any worker
+process can read any member without extracting the others. Note that
+members of a compressed tar (.tar.gz, .tgz) can only be reached by
+decompressing the archive up to them, so prefer zip or plain tar for
+parallel imports.
+"""
+import io
+import os
+import re
+import gzip
+import tarfile
+import zipfile
+import threading
+
+SEP = '!'
+_archive_pattern = re.compile(r"^(.*\.(?:zip|tar|tar\.gz|tgz))!(.+)$")
+
+# opened archives of the current process; pid -> {path: archive}
+_archives = dict()
+
+
+def is_archive(path):
+    return os.path.isfile(path) and \
+        re.search(r"\.(zip|tar|tar\.gz|tgz)$", path) is not None
+
+
+def split(src):
+    """split a source into (archive, member); archive is None for files"""
+    m = _archive_pattern.match(src)
+    if m is None:
+        return None, src
+    return m.group(1), m.group(2)
+
+
+def list_sources(path, dir_pattern, ext):
+    """list the source files in a directory tree or an archive
+
+    :param path: data directory or archive
+    :param dir_pattern: regex that the name of the parent directory of a
+        source file must match
+    :param ext: file name extension of the source files
+    :return: list of sources
+    """
+    sources = []
+    if is_archive(path):
+        for name in _archive(path).names():
+            parts = name.split('/')
+            if len(parts) < 2 or not re.match(dir_pattern, parts[-2]):
+                continue
+            if name.endswith(ext):
+                sources.append(path + SEP + name)
+        return sources
+
+    for root, dirs, files in os.walk(path):
+        if not re.match(dir_pattern, root.split(os.sep)[-1]):
+            continue
+        for file in files:
+            if not file.endswith(ext):
+                continue
+            sources.append(os.path.join(root, file))
+    return sources
+
+
+def open_source(src):
+    """open a source for reading (binary); gzipped sources are decompressed"""
+    archive, member = split(src)
+    if archive is None:
+        return gzip.open(src) if src.endswith('.gz') else open(src, 'rb')
+    f = io.BytesIO(_archive(archive).read(member))
+    return gzip.GzipFile(fileobj=f) if src.endswith('.gz') else f
+
+
+def fingerprint(src):
+    """size and mtime of a source, or None if it cannot be found"""
+    archive, member = split(src)
+    if archive is None:
+        try:
+            st = os.stat(src)
+        except OSError:
+            return None
+        return '{}\t{}'.format(st.st_size, int(st.st_mtime))
+    try:
+        size, mtime = _archive(archive).stat(member)
+    except KeyError:
+        return None
+    return '{}\t{}'.format(size, mtime)
+
+
+def _archive(path):
+    """opened archive of the current process (file handles are not shared
+    with forked workers)"""
+    opened = _archives.setdefault(os.getpid(), dict())
+    if path not in opened:
+        if path.endswith('.zip'):
+            opened[path] = _ZipArchive(path)
+        else:
+            opened[path] = _TarArchive(path)
+    return opened[path]
+
+
+class _ZipArchive(object):
+    def __init__(self, path):
+        self.zf = zipfile.ZipFile(path)
+
+    def names(self):
+        return [i.filename for i in self.zf.infolist() if not i.is_dir()]
+
+    def read(self, member):
+        return self.zf.read(member)
+
+    def stat(self, member):
+        info = self.zf.getinfo(member)
+        return info.file_size, '{}:{:08x}'.format(
+            '-'.join(str(x) for x in info.date_time), info.CRC)
+
+
+class _TarArchive(object):
+    def __init__(self, path):
+        self.path = path
+        self.members = self._load_index()  # name -> (offset, size, mtime)
+        self.compressed = not path.endswith('.tar')
+        self.fh = None
+        # the handle is shared by the threads of the process (transform and
+        # poster threads), and a read is a seek then a read
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        """read the member index, or build it by scanning the archive"""
+        idx_file = self.path + '.idx'
+        st = os.stat(self.path)
+        stamp = '{}\t{}'.format(st.st_size, int(st.st_mtime))
+        if os.path.exists(idx_file):
+            with open(idx_file) as f:
+                if f.readline().rstrip('\n') == stamp:
+                    members = dict()
+                    for line in f:
+                        name, offset, size, mtime = \
+                            line.rstrip('\n').rsplit('\t', 3)
+                        members[name] = (int(offset), int(size), int(mtime))
+                    return members
+
+        members = dict()
+        with tarfile.open(self.path) as tf:
+            for info in tf:
+                if info.isfile():
+                    members[info.name] = \
+                        (info.offset_data, info.size, int(info.mtime))
+        try:
+            with open(idx_file + '.tmp', 'w') as f:
+                f.write(stamp + '\n')
+                for name, (offset, size, mtime) in members.items():
+                    f.write('{}\t{}\t{}\t{}\n'.format(name, offset, size,
+                                                      mtime))
+            os.replace(idx_file + '.tmp', idx_file)
+        except OSError:
+            pass  # read-only location; scan again next time
+        return members
+
+    def names(self):
+        return list(self.members.keys())
+
+    def read(self, member):
+        offset, size, _ = self.members[member]
+        with self._lock:
+            if self.fh is None:
+                self.fh = gzip.open(self.path) if self.compressed \
+                    else open(self.path, 'rb')
+            self.fh.seek(offset)
+            return self.fh.read(size)
+
+    def stat(self, member):
+        _, size, mtime = self.members[member]
+        return size, mtime
@@ -0,0 +1,221 @@
+""" source document transformers producing solr update documents
+
+These build the same fields as the xslt files in the config directory, but
+without loading a whole source file into one DOM tree.
+"""
+import os
+import re
+import sys
+import json
+import lxml.etree as et
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from Trec2017pm import sources
+
+# xsl:value-of equivalents (string value of the first matching node)
+_xp_pmid = et.XPath('string(MedlineCitation/PMID)')
+_xp_journal = et.XPath('string(Journal/Title)')
+_xp_subject = et.XPath('string(ArticleTitle)')
+_xp_abstract = et.XPath('string(Abstract/AbstractText)')
+_xp_chemical = et.XPath('string(NameOfSubstance)')
+_xp_chemical_ui = et.XPath('string(NameOfSubstance/@UI)')
+
+
+def medline_fields(article):
+    """extract the fields of a PubmedArticle element, identical to what
+    articles.xsl produces for the article
+
+    :param article: PubmedArticle element
+    :return: list of (field name, value) pairs
+    """
+    fields = [('id', _xp_pmid(article))]
+    for art in article.iterfind('MedlineCitation/Article'):
+        fields.append(('journal-title', _xp_journal(art)))
+        fields.append(('subject', _xp_subject(art)))
+        fields.append(('abstract', _xp_abstract(art)))
+    for mesh in article.iterfind('MedlineCitation/MeshHeadingList/'
+                                 'MeshHeading/DescriptorName'):
+        fields.append(('meshHeading', mesh.xpath('string()')))
+        fields.append(('MeshHeading_UI', mesh.get('UI', '')))
+    for chem in article.iterfind('MedlineCitation/ChemicalList/Chemical'):
+        fields.append(('Chemical', _xp_chemical(chem)))
+        fields.append(('Chemical_UI', _xp_chemical_ui(chem)))
+    return fields
+
+
+def iter_medline_fields(file):
+    """read a medline file incrementally and yield the fields of each article
+
+    PubmedArticle elements are parsed one at a time and cleared as soon as
+    they are converted, so memory use does not grow with the file size.
+
+    :param file: medline xml source (optionally gzipped)
+    :return: generator of lists of (field name, value) pairs
+    """
+    with sources.open_source(file) as f:
+        for _, article in et.iterparse(f, events=('end',),
+                                       tag='PubmedArticle', huge_tree=True):
+            yield medline_fields(article)
+            # release the parsed article and its preceding siblings
+            article.clear()
+            while article.getprevious() is not None:
+                del article.getparent()[0]
+
+
+def iter_medline_docs(file, fmt='json'):
+    """read a medline file incrementally and yield serialized solr documents
+
+    :param file: medline xml source (optionally gzipped)
+    :param fmt: 'json' or 'xml' solr documents
+    :return: generator of serialized documents
+    """
+    serialize = SERIALIZERS[fmt]
+    for fields in iter_medline_fields(file):
+        yield serialize(fields)
+
+
+# trials.xsl: study_design_info children and their field names (sic, the
+# intervention_model_description goes to primary_purpose)
+_study_design_fields = {
+    'allocation': 'study_design_info-allocation',
+    'intervention_model': 'study_design_info-intervention_model',
+    'intervention_model_description': 'study_design_info-primary_purpose',
+    'primary_purpose': 'study_design_info-primary_purpose',
+    'observational_model': 'study_design_info-observational_model',
+    'time_perspective': 'study_design_info-time_perspective',
+    'masking': 'study_design_info-masking',
+    'masking_description': 'study_design_info-masking_description',
+}
+
+_age_units = {
+    'Year': 365,
+    'Years': 365,
+    'Month': 30,
+    'Months': 30,
+    'Week': 7,
+    'Weeks': 7,
+    'Day': 1,
+    'Days': 1,
+    'Hour': 1 / 24,
+    'Hours': 1 / 24,
+    'Minute': 1 / 24 / 60,
+    'Minutes': 1 / 24 / 60,
+}
+_age_pattern = re.compile(r"([1-9]*[0-9]+) (Year|Years|Month|Months|Week|"
+                          r"Weeks|Day|Days|Hour|Hours|Minute|Minutes)")
+
+
+def age_days(age, default):
+    """normalize age pattern into days (ex. 10 Years => 10 * 365)
+
+    :param age: age string of a trial (ex. '18 Years', 'N/A')
+    :param default: days returned when the age is not given
+    """
+    if age == 'N/A' or not age:
+        return default
+    m = _age_pattern.match(age)
+    return int(m.group(1)) * _age_units[m.group(2)]
+
+
+def _string(elm):
+    """string value of an element (xsl:value-of)"""
+    if len(elm) == 0:
+        return elm.text or ''
+    return elm.xpath('string()')
+
+
+def _first(root, path):
+    elm = root.find(path)
+    return '' if elm is None else _string(elm)
+
+
+def trial_fields(root):
+    """extract the fields of a clinical_study element, in the same order and
+    with the same values as trials.xsl followed by utils.age_normalize
+
+    :param root: clinical_study element
+    :return: list of (field name, value) pairs
+    """
+    fields = [
+        ('id', _first(root, 'id_info/nct_id')),
+        ('brief_title', _first(root, 'brief_title')),
+        ('official_title', _first(root, 'official_title')),
+    ]
+    for e in root.iterfind('brief_summary/textblock'):
+        fields.append(('brief_summary', _string(e)))
+    for e in root.iterfind('detailed_description/textblock'):
+        fields.append(('detailed_description', _string(e)))
+    fields.append(('overall_status', _first(root, 'overall_status')))
+    fields.append(('phase', _first(root, 'phase')))
+    fields.append(('study_type', _first(root, 'study_type')))
+    for e in root.iterfind('study_design_info/*'):
+        if e.tag in _study_design_fields:
+            fields.append((_study_design_fields[e.tag], _string(e)))
+    fields.append(('condition', _first(root, 'condition')))
+
+    # "<type>: <name> <others> ..." over all the intervention children
+    values = [_string(e) for e in root.iterfind('intervention/*')]
+    intervention = ''
+    for i, v in enumerate(values):
+        intervention += v
+        if i == 0:
+            intervention += ':'
+        if i != len(values) - 1:
+            intervention += ' '
+    fields.append(('intervention', intervention))
+
+    for e in root.iterfind('eligibility/criteria'):
+        fields.append(('eligibility-criteria',
+                       ' '.join(_string(t) for t in e.iterfind('textblock'))))
+    min_age = _first(root, 'eligibility/minimum_age')
+    max_age = _first(root, 'eligibility/maximum_age')
+    fields.append(('eligibility-gender', _first(root, 'eligibility/gender')))
+    fields.append(('eligibility-minimum_age', min_age))
+    fields.append(('eligibility-maximum_age', max_age))
+    for e in root.iterfind('keyword'):
+        fields.append(('keyword', _string(e)))
+    for e in root.iterfind('condition_browse/mesh_term'):
+        fields.append(('condition_browse', _string(e)))
+    for e in root.iterfind('intervention_browse/mesh_term'):
+        fields.append(('intervention_browse', _string(e)))
+
+    fields.append(('eligibility-min_age_norm', age_days(min_age, 0)))
+    fields.append(('eligibility-max_age_norm',
+                   age_days(max_age, 200 * _age_units['Years'])))
+    return fields
+
+
+def json_doc(fields):
+    """serialize (field name, value) pairs as a solr json document; repeated
+    fields become multi-valued"""
+    doc = dict()
+    for name, value in fields:
+        if name not in doc:
+            doc[name] = value
+        elif isinstance(doc[name], list):
+            doc[name].append(value)
+        else:
+            doc[name] = [doc[name], value]
+    return json.dumps(doc).encode()
+
+
+def xml_doc(fields):
+    """serialize (field name, value) pairs as a solr <doc> element"""
+    doc = et.Element('doc')
+    for name, value in fields:
+        et.SubElement(doc, 'field', name=name).text = str(value)
+    return et.tostring(doc)
+
+
+SERIALIZERS = {
+    'json': json_doc,
+    'xml': xml_doc,
+}
+
+
+def iter_trial_docs(file, fmt='json'):
+    """transform a trial xml file into a serialized solr document, without
+    the xslt and DOM round trip of trials.xsl"""
+    with sources.open_source(file) as f:
+        root = et.parse(f).getroot()
+    yield SERIALIZERS[fmt](trial_fields(root))
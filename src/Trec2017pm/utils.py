@@ -2,25 +2,32 @@ import os
 import re
 import sys
 import lxml.etree as et
-from nltk import sent_tokenize
 from itertools import chain
 import subprocess
-from nltk.corpus import stopwords
 import itertools
-import json
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 from config import config as cfg
 from Trec2017pm.logger import Logger
-from pymetamap import MetaMap
+from Trec2017pm import transform
+from Trec2017pm import concepts
+from Trec2017pm import metamap
 from umls_api import UMLS_api
 from mod_api import MOD_api
+from local_api import LOCAL_api
 
 logger = Logger()  # singleton
-mm = MetaMap.get_instance('/opt/public_mm/bin/metamap16')
-
-stopwords = stopwords.words('english')
 extra_stopwords = ['gene']
+_stopwords = None
+
+
+def get_stopwords():
+    """english stopwords of nltk (loaded on first use)"""
+    global _stopwords
+    if _stopwords is None:
+        from nltk.corpus import stopwords
+        _stopwords = set(stopwords.words('english'))
+    return _stopwords
 
 
 def escape_special_chars(text, esc_chars="+-^~:", rm_chars="&|!(){}[]*?\/"):
@@ -33,35 +40,11 @@ def escape_special_chars(text, esc_chars="+-^~:", rm_chars="&|!(){}[]*?\/"):
 
 def age_normalize(dom):
     """normalize age pattern into days (ex. 10 Years => 10 * 365)"""
-    units = {
-        'Year': 365,
-        'Years': 365,
-        'Month': 30,
-        'Months': 30,
-        'Week': 7,
-        'Weeks': 7,
-        'Day': 1,
-        'Days': 1,
-        'Hour': 1 / 24,
-        'Hours': 1 / 24,
-        'Minute': 1 / 24 / 60,
-        'Minutes': 1 / 24 / 60,
-    }
-    # age pattern
-    pattern = r"([1-9]*[0-9]+) (Year|Years|Month|Months|Week|Weeks|" \
-              r"Day|Days|Hour|Hours|Minute|Minutes)"
-
     min_age = dom.xpath("/doc/field[@name='eligibility-minimum_age']")[0].text
-    min_age_norm = 0
-    if min_age != 'N/A' and min_age:
-        m = re.match(pattern, min_age)
-        min_age_norm = int(m.group(1)) * units[m.group(2)]
+    min_age_norm = transform.age_days(min_age, 0)
 
     max_age = dom.xpath("/doc/field[@name='eligibility-maximum_age']")[0].text
-    max_age_norm = 200 * units['Years']
-    if max_age != 'N/A' and max_age:
-        m = re.match(pattern, max_age)
-        max_age_norm = int(m.group(1)) * units[m.group(2)]
+    max_age_norm = transform.age_days(max_age, 200 * 365)
 
     fld_min = et.Element("field", name="eligibility-min_age_norm", type="float")
     fld_min.text = str(min_age_norm)
@@ -75,7 +58,13 @@ def age_normalize(dom):
 
 
 def get_meshheading(phrase):
-    concepts, error = mm.extract_concepts([phrase], **cfg.CONF_MM)
+    """preferred name of the first metamap concept of a phrase, or None"""
+    return concepts.lookup('mm-mesh', phrase, _extract_meshheading)
+
+
+def _extract_meshheading(phrase):
+    concepts, error = metamap.get_instance().extract_concepts(
+        [phrase], **cfg.CONF_MM)
     # assuming that the first concept is the most related one with the
     # highest score
     if len(concepts):
@@ -84,9 +73,105 @@ def get_meshheading(phrase):
         return None
 
 
+def get_meshheadings(phrases):
+    """get_meshheading of many phrases, with one metamap call for the
+    phrases missing in the concept store
+
+    :return: dict of phrase -> preferred name or None
+    """
+    store = concepts.store()
+    results = dict()
+    for p in phrases:
+        found, value = store.get('mm-mesh', p)
+        if found:
+            results[p] = value
+    todo = [p for p in dict.fromkeys(phrases) if p not in results]
+    if len(todo) > 0:
+        extracted, error = metamap.get_instance().extract_concepts(
+            todo, ids=[str(i) for i in range(len(todo))], **cfg.CONF_MM)
+        if error:
+            raise RuntimeError('metamap failed: {}'.format(error))
+        for c in reversed(extracted):  # keep the first concept of a phrase
+            results[todo[int(str(c.index).strip('\'"'))]] = c.preferred_name
+        for p in todo:
+            results.setdefault(p, None)
+            store.put('mm-mesh', p, results[p])
+    return results
+
+
+def umls_client():
+    """umls client of the backend (CONF_UMLS['backend'])"""
+    if cfg.CONF_UMLS['backend'] == 'local':
+        return local_client()
+    return UMLS_api.get_client(pool_size=cfg.CONF_UMLS['pool_size'],
+                               auth=cfg.CONF_UMLS['auth'])
+
+
+_local_client = None
+
+
+def local_client():
+    """client of the local thesaurus index (PATHS['thesaurus'])"""
+    global _local_client
+    if _local_client is None:
+        _local_client = LOCAL_api.Client(cfg.PATHS['thesaurus'])
+    return _local_client
+
+
+def umls_search(term):
+    """umls search result of a term (see UMLS_api.Client.get_cuis)"""
+    if cfg.CONF_UMLS['backend'] == 'local':
+        return local_client().get_cuis(term)
+    return concepts.lookup('umls-search', term,
+                           lambda t: umls_client().get_cuis(t))
+
+
+def umls_atoms(cui):
+    """atoms of a umls concept, or None"""
+    if cfg.CONF_UMLS['backend'] == 'local':
+        return local_client().get_atoms(cui)
+    return concepts.lookup('umls-atoms', cui,
+                           lambda c: umls_client().get_atoms(c))
+
+
+def umls_prefetch(terms):
+    """resolve the search results and atoms of many terms at once, and put
+    them in the concept store; terms already stored are not requested
+
+    :return: terms of the failed lookups
+    """
+    if cfg.CONF_UMLS['backend'] == 'local':
+        return []  # nothing to fetch
+    store = concepts.store()
+    todo = [t for t in terms if not store.get('umls-search', t)[0]]
+    if len(todo) == 0:
+        return []
+    failed = []
+    for term, resolved in umls_client().get_concepts(todo).items():
+        if resolved is None:
+            failed.append(term)  # not stored; requested again later
+            continue
+        cuis, atoms = resolved
+        store.put('umls-search', term, cuis)
+        results = (cuis or {}).get('results') or []
+        if len(results) > 0 and results[0]['ui'] != 'NONE':
+            store.put('umls-atoms', results[0]['ui'], atoms)
+    return failed
+
+
+def mod_mesh(term):
+    """MeSH on Demand headings of a term, or None"""
+    if cfg.CONF_UMLS['backend'] == 'local':
+        return local_client().get_mesh(term)
+    return concepts.lookup('mod-mesh', term,
+                           lambda t: MOD_api.Client().get_mesh(t))
+
+
 def extract_cuis(docs):
     """this takes so much time for parsing the entire document collection.
-    Moving forward to exploit umls_api synonyms using its rest-api"""
+    Moving forward to exploit umls_api synonyms using its rest-api
+    (see solr.run_enrich_cuis for a parallel, cached pass over the index)"""
+    from nltk import sent_tokenize
     extract_from = ['subject', 'abstract']
     for d in docs.xpath("//doc"):
         text = []
@@ -94,8 +179,8 @@ def extract_cuis(docs):
             for elm in d.xpath("./field[@name='{}']".format(field)):
                 if elm.text and len(elm.text) > 0:
                     text.append(' '.join(sent_tokenize(elm.text)))
-        concepts, error = \
-            mm.extract_concepts([' '.join(text)], **cfg.CONF_MM)
+        concepts, error = metamap.get_instance().extract_concepts(
+            [' '.join(text)], **cfg.CONF_MM)
 
         for c in concepts:
             # print("{:>6} | {} => {} [{}, semtypes:{}]"
@@ -146,6 +231,111 @@ def parse_topics(path, target='a'):
     return queries
 
 
+def parse_topics_conj(path, target='a'):
+    """queries of the topics for the single pass conjunctive up-rank
+    (solr.run_queries): the default query in 'query' and the conjunctive
+    one in 'conj'"""
+    enabled = cfg.CONF_SOLR['enable_conj_uprank']
+    try:
+        cfg.CONF_SOLR['enable_conj_uprank'] = False
+        queries = parse_topics(path, target)
+        cfg.CONF_SOLR['enable_conj_uprank'] = True
+        for q, q_cjt in zip(queries, parse_topics(path, target)):
+            q['conj'] = q_cjt['query']
+    finally:
+        cfg.CONF_SOLR['enable_conj_uprank'] = enabled
+    return queries
+
+
+def prefetch_topics(paths):
+    """resolve all the expansion lookups of the topics (diseases, genes and
+    mutations) concurrently into the concept store, so that parse_topics
+    runs without waiting on the services afterwards
+
+    Lookups already in the store are not requested again. The number of
+    requests in flight is bounded per service (CONF_PREFETCH; umls lookups
+    are batched by umls_prefetch, bounded by CONF_UMLS['pool_size']).
+
+    :param paths: topic files
+    :return: number of failed lookups
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait
+
+    diseases, genes, mutations = [], [], []
+    for path in paths:
+        for t in et.parse(path).iterfind('.//topic'):
+            diseases.append(t[0].text)
+            for gene_phrase in t[1].text.split(','):
+                gene_name, mutation = split_gene_phrase(gene_phrase)
+                genes.extend(gene_name.split('-'))
+                mutations.append((gene_name, mutation))
+    diseases = list(dict.fromkeys(diseases))
+    genes = list(dict.fromkeys(genes))
+    mutations = list(dict.fromkeys(mutations))
+    logger.log('INFO', 'prefetching expansions of {} diseases, {} genes, {} '
+                       'mutations'.format(len(diseases), len(genes),
+                                          len(mutations)), printout=True)
+
+    executors = {k: ThreadPoolExecutor(v)
+                 for k, v in cfg.CONF_PREFETCH.items()}
+    failed = []
+
+    def run(service, func, terms):
+        """submit the lookups of the terms; futures of (term, result)"""
+        def lookup(term):
+            try:
+                return term, func(term)
+            except Exception as e:
+                logger.log('WARNING', 'prefetching {} [{}] failed: {}'.
+                           format(func.__name__, term, e))
+                failed.extend(term if isinstance(term, list) else [term])
+                return term, None
+        return [executors[service].submit(lookup, t) for t in terms]
+
+    try:
+        # - independent lookups; umls search results and atoms of the first
+        #   concepts in a batch (umls_prefetch)
+        searched, meshes = [], []
+        if cfg.CONF_SOLR['qe_umls']:
+            searched = diseases + genes + [
+                m for _, m in mutations if m not in cfg.CONF_MUT_TYPES]
+            umls = executors['umls'].submit(umls_prefetch, searched)
+            # one batched metamap call
+            meshes = run('metamap', get_meshheadings, [[
+                g + ' ' + m for g, m in mutations
+                if m not in cfg.CONF_MUT_TYPES]])
+        if cfg.CONF_SOLR['qe_MoD']:
+            meshes += run('mod', mod_mesh, diseases + genes + [
+                m for _, m in mutations if len(m) > 0])
+
+        # - lookups depending on the search results: the mesh heading of
+        #   the disease and gene concepts
+        names = []
+        if len(searched) > 0:
+            try:
+                failed.extend(umls.result())
+                for term in dict.fromkeys(diseases + genes):
+                    if term in failed:
+                        continue
+                    # in the store after umls_prefetch
+                    results = (umls_search(term) or {}).get('results') or []
+                    if len(results) > 0:
+                        names.append(results[0]['name'])
+            except Exception as e:
+                logger.log('WARNING', 'prefetching umls concepts failed: {}'.
+                           format(e))
+                failed.extend(searched)
+        if len(names) > 0:
+            meshes += run('metamap', get_meshheadings, [names])
+        wait(meshes)
+    finally:
+        for executor in executors.values():
+            executor.shutdown()
+    logger.log('INFO', 'prefetching completed; {} lookups failed'.
+               format(len(failed)), printout=True)
+    return len(failed)
+
+
 def parse_disease(val, t_no, target):
     """
     given disease name (ex. "Pancreatic Cancer"), build query string by its
@@ -162,44 +352,16 @@ def parse_disease(val, t_no, target):
     # query expansion (umls)
     if cfg.CONF_SOLR['qe_umls']:
         # append synonyms in the disease name group
-        cache_file = "{}/t{}-disease.umls".format(cfg.PATHS['cache'], t_no)
-        qe = {'atoms': [], 'preferred_name': ''}
-        if not os.path.exists(cache_file):
-            with UMLS_api.Client() as client:
-                cuis = client.get_cuis(val)
-                atoms = client.get_atoms(cuis['results'][0]['ui'])
-                mesh_preferred = get_meshheading(cuis['results'][0]['name'])
-                atom_names = set()
-                for a in atoms:
-                    atom_names.add(a['name'].lower())
-                qe['atoms'] = list(atom_names)
-                qe['preferred_name'] = mesh_preferred
-            # write qe to a chache file
-            with open(cache_file, 'w') as fout:
-                json.dump(qe, fout)
-        else:
-            with open(cache_file) as fin:
-                try:
-                    qe = json.load(fin)
-                except:
-                    pass
-        d_name.extend(qe['atoms'])
-        d_mesh.append(qe['preferred_name'])
+        cuis = umls_search(val)
+        atoms = umls_atoms(cuis['results'][0]['ui']) or []
+        atom_names = set()
+        for a in atoms:
+            atom_names.add(a['name'].lower())
+        d_name.extend(atom_names)
+        d_mesh.append(get_meshheading(cuis['results'][0]['name']))
     # query expansion (mod)
     if cfg.CONF_SOLR['qe_MoD']:
-        cache_file = "{}/t{}-disease.mod".format(cfg.PATHS['cache'], t_no)
-        qe = []  # list of mesh headings
-        if not os.path.exists(cache_file):
-            with MOD_api.Client() as client:
-                qe = client.get_mesh(val)
-            with open(cache_file, 'w') as fout:
-                json.dump(qe, fout)
-        else:
-            with open(cache_file) as fin:
-                try:
-                    qe = json.load(fin)
-                except:
-                    pass
+        qe = mod_mesh(val) or []  # list of mesh headings
         d_name.extend(qe)
         d_mesh.extend(qe)
 
@@ -218,6 +380,34 @@ def parse_disease(val, t_no, target):
     return q_phrase
 
 
+def split_gene_phrase(gene_phrase):
+    """split a gene phrase of a topic into the gene name and the mutation
+    (empty if not given)
+
+    patterns:
+        1. braf (v600e)
+        2. KIT Exon 9 (A502_Y503dup)
+        3. CDK4 Amplification
+        4. NTRK1
+    """
+    gene_phrase = gene_phrase.strip().lower()
+    m = re.match(r"([\w-]+)\s\((\w+)\)", gene_phrase)
+    if m:
+        return m.group(1), m.group(2)
+    # ex) KIT Exon 9 (A502_Y503dup)
+    m = re.match(r"^([\w\s]+)\s\(([\w\s_]+)\)$", gene_phrase)
+    if m:
+        return m.group(1), m.group(2)
+    # ex) CDK4 amplification
+    mutation_keys = cfg.CONF_MUT_TYPES.keys()
+    m = re.match(r"^([\w-]+)\s({})$"
+                 "".format('|'.join(mutation_keys)), gene_phrase)
+    if m:
+        return m.group(1), m.group(2)
+    # otherwise; ex) NTRK1
+    return gene_phrase, ''
+
+
 def parse_gene(val, t_no, target):
     """
     parse gene field from the topics and build a query
@@ -378,62 +568,14 @@ def parse_gene(val, t_no, target):
     #
     # return q_phrase
 
-    # read-in caches
+    # expansions of the gene names and mutations (concept store)
     qe_umls = dict()
     qe_mod = dict()
-    update_umls = False
-    update_mod = False
-    cache_umls = "{}/t{}-gene.umls".format(cfg.PATHS['cache'], t_no)
-    cache_mod = "{}/t{}-gene.mod".format(cfg.PATHS['cache'], t_no)
-    if cfg.CONF_SOLR['qe_umls'] and os.path.exists(cache_umls):
-        with open(cache_umls) as fin:
-            try:
-                qe_umls = json.load(fin)
-            except:
-                pass
-    if cfg.CONF_SOLR['qe_MoD'] and os.path.exists(cache_mod):
-        with open(cache_mod) as fin:
-            try:
-                qe_mod = json.load(fin)
-            except:
-                pass
 
     # parse gene tag first
     gene_group = []
     for gene_phrase in val.split(','):
-        gene_phrase = gene_phrase.strip().lower()
-        # find a pattern
-        #   1. braf (v600e)
-        #   2. KIT Exon 9 (A502_Y503dup)
-        #   3. EML4-ALK Fusion
-        #   4. NTRK1
-        pattern_found = False
-        if not pattern_found:
-            m = re.match(r"([\w-]+)\s\((\w+)\)", gene_phrase)
-            if m:
-                gene_name = m.group(1)
-                mutation = m.group(2)
-                pattern_found = True
-        if not pattern_found:
-            # ex) KIT Exon 9 (A502_Y503dup)
-            m = re.match(r"^([\w\s]+)\s\(([\w\s_]+)\)$", gene_phrase)
-            if m:
-                gene_name = m.group(1)
-                mutation = m.group(2)
-                pattern_found = True
-        if not pattern_found:
-            # ex) CDK4 amplification
-            mutation_keys = cfg.CONF_MUT_TYPES.keys()
-            m = re.match(r"^([\w-]+)\s({})$"
-                         "".format('|'.join(mutation_keys)), gene_phrase)
-            if m:
-                gene_name = m.group(1)
-                mutation = m.group(2)
-                pattern_found = True
-        if not pattern_found:
-            # otherwise; ex) NTRK1
-            gene_name = gene_phrase
-            mutation = ''
+        gene_name, mutation = split_gene_phrase(gene_phrase)
         gene_group.append((gene_name, mutation))
         gene_names = gene_name.split('-')
         mut_names = [mutation]  # singleton for now
@@ -446,9 +588,8 @@ def parse_gene(val, t_no, target):
             for gene in gene_names:
                 if gene in qe_umls:
                     continue
-                client = UMLS_api.Client()
-                cuis = client.get_cuis(gene)
-                atoms = client.get_atoms(cuis['results'][0]['ui'])
+                cuis = umls_search(gene)
+                atoms = umls_atoms(cuis['results'][0]['ui']) or []
                 qe_umls[gene] = {
                     'gene_mesh': [get_meshheading(cuis['results'][0]['name'])]
                 }
@@ -459,10 +600,10 @@ def parse_gene(val, t_no, target):
                     t = re.sub(r'\(.*\)', '', t)
                     # remove stop words
                     t = [a for a in t.split()
-                         if a not in stopwords and a not in extra_stopwords]
+                         if a not in get_stopwords() and
+                         a not in extra_stopwords]
                     atom_names |= set(t)  # union
                 qe_umls[gene]['gene_atoms'] = list(atom_names)
-                update_umls = True
             # handle mutation
             for mut in mut_names:
                 if len(gene_name.split('-')) > 1 and gene_name not in qe_umls:
@@ -493,9 +634,8 @@ def parse_gene(val, t_no, target):
                 mesh_preferred = get_meshheading(gene_name + ' ' + mut)
                 if mesh_preferred is not None:
                     qe_umls[gene_name]['mut_mesh'].append(mesh_preferred)
-                client = UMLS_api.Client()
-                cuis = client.get_cuis(mut)
-                atoms = client.get_atoms(cuis['results'][0]['ui'])
+                cuis = umls_search(mut)
+                atoms = umls_atoms(cuis['results'][0]['ui'])
                 if atoms is None:
                     continue
                 terms = set()
@@ -505,7 +645,8 @@ def parse_gene(val, t_no, target):
                     t = re.sub(r'\(.*\)', '', t)
                     # remove stopwords
                     t = [a for a in t.split()
-                         if a not in stopwords and a not in extra_stopwords]
+                         if a not in get_stopwords() and
+                         a not in extra_stopwords]
                     # extract the key token
                     # ex. from np_004963.1:p.val617phe to val617phe
                     for t_ in t:
@@ -513,30 +654,17 @@ def parse_gene(val, t_no, target):
                             if re.search(r'{}'.format(num_clue), tok):
                                 terms.add(tok)
                 qe_umls[gene_name]['mut_atoms'].extend(terms)
-                update_umls = True
 
         # query expansion (mod)
         if cfg.CONF_SOLR['qe_MoD']:
             for gene in gene_names:
                 if gene in qe_mod:
                     continue
-                with MOD_api.Client() as client:
-                    qe_mod[gene] = client.get_mesh(gene)
-                    update_mod = True
+                qe_mod[gene] = mod_mesh(gene) or []
             for mut in mut_names:
                 if len(mut) == 0 or mut in qe_mod:
                     continue
-                with MOD_api.Client() as client:
-                    qe_mod[mut] = client.get_mesh(mut)
-                    update_mod = True
-
-    # write updates
-    if update_umls:
-        with open(cache_umls, 'w') as fout:
-            json.dump(qe_umls, fout)
-    if update_mod:
-        with open(cache_mod, 'w') as fout:
-            json.dump(qe_mod, fout)
+                qe_mod[mut] = mod_mesh(mut) or []
 
     # build query phrase
     q_phrase = ''
@@ -766,6 +894,10 @@ def run_evaluators(path):
     """ run two evaluators (trec_eval and sample_eval for inferred metrics),
     and then store the results for future references. (note only the results
     of articles is available due to its ground truth existence
+
+    The measures are computed in process (evaluation.py) unless
+    CONF_EVAL['evaluator'] is 'tools', for the trec_eval and sample_eval
+    executables.
     :param path: path to the directory of a specific run, or the file of topics
     :return: store evaluation result and return on success
     """
@@ -788,10 +920,21 @@ def run_evaluators(path):
         logger.log('ERROR', 'input file for evaluation not found')
         return 1
 
-    # run trec_eval
-    output = subprocess.check_output(
-        [cfg.PATHS['trec_eval'], '-q', cfg.PATHS['rel_file'], top_docs])
-    output = output.decode('ascii')
+    if cfg.CONF_EVAL['evaluator'] == 'tools':
+        output, output_s = run_eval_tools(top_docs)
+    else:
+        from Trec2017pm import evaluation
+        result = evaluate_run(top_docs)
+        if len(result) == 0:
+            logger.log('ERROR', 'no topic of the run has relevant documents',
+                       printout=True)
+            return 0, 0
+        output = evaluation.format_results(
+            result, ['num_ret', 'num_rel', 'num_rel_ret', 'map', 'bpref'] +
+            ['P_{}'.format(k) for k in evaluation.CUTOFFS])
+        output_s = evaluation.format_results(
+            {'infAP': result['s_infAP'], 'infNDCG': result['s_infNDCG']})
+
     with open(eval_res, 'a') as eval:
         eval.write(output)
     for line in output.splitlines():
@@ -799,18 +942,14 @@ def run_evaluators(path):
             if re.search(r"all", line):
                 print(line)
 
-    # run sample_eval
-    output = subprocess.check_output(
-        [cfg.PATHS['sample_eval'], '-q', cfg.PATHS['rel_file_s'], top_docs])
-    output = output.decode('ascii')
     with open(eval_res, 'a') as eval:
-        eval.write(output)
+        eval.write(output_s)
         logger.log('INFO', 'evaluation output saved [{}]'.format(eval_res),
                    printout=True)
 
     infAP_all = 0
     infNDCG_all = 0
-    for line in output.splitlines():
+    for line in output_s.splitlines():
         if re.search(r"infAP", line):
             if re.search(r"all", line):
                 print(line)
@@ -822,3 +961,35 @@ def run_evaluators(path):
 
     return infAP_all, infNDCG_all
 
+
+def evaluate_run(top_docs, rel_file=None, rel_file_s=None):
+    """measures of a run file by topic, computed in process
+
+    :param rel_file, rel_file_s: qrels (default: PATHS['rel_file'] and
+        PATHS['rel_file_s'])
+    :return: dict of measure -> dict of topic (and 'all') -> value; the
+        measures of sample_eval are prefixed with 's_'
+    """
+    from Trec2017pm import evaluation
+    return evaluation.evaluate(
+        evaluation.read_run(top_docs),
+        evaluation.get_qrels(rel_file or cfg.PATHS['rel_file']),
+        evaluation.get_qrels(rel_file_s or cfg.PATHS['rel_file_s'],
+                             sampled=True))
+
+
+def run_eval_tools(top_docs, measures=None):
+    """outputs of trec_eval and sample_eval on a run file
+
+    :param measures: trec_eval measures (-m); its default set if None
+    """
+    command = [cfg.PATHS['trec_eval'], '-q']
+    for m in measures or []:
+        command.extend(['-m', m])
+    output = subprocess.check_output(
+        command + [cfg.PATHS['rel_file'], top_docs]).decode('ascii')
+    output_s = subprocess.check_output(
+        [cfg.PATHS['sample_eval'], '-q', cfg.PATHS['rel_file_s'],
+         top_docs]).decode('ascii')
+    return output, output_s
+
@@ -18,17 +18,41 @@ PATHS = {
     'data-trials': os.path.join(base_dir, 'data/clinicaltrials'),
     'topics': os.path.join(base_dir, 'data/topics2017.xml'),
     'cache': os.path.join(base_dir, 'data/cache'),
+    'trials-index': os.path.join(base_dir, 'var/trials.index'),
+    'cui-journal': os.path.join(base_dir, 'var/cuis.journal'),
+    'cui-cache': os.path.join(base_dir, 'data/cache/cuis.sqlite'),
+    'concepts': os.path.join(base_dir, 'data/cache/concepts.sqlite'),
+    'features': os.path.join(base_dir, 'var/features-exp12.npz'),
+    'q-templates': os.path.join(base_dir, 'var/q_tmpl-exp12'),
+    'optimize-checkpoint': os.path.join(base_dir, 'var/optimize.journal'),
+    'solr-cache': os.path.join(base_dir, 'data/cache/responses.sqlite'),
+    'thesaurus': os.path.join(base_dir, 'data/thesaurus'),
+    'umls-mrconso': os.path.join(base_dir, 'data/umls/MRCONSO.RRF'),
+    'umls-mrsty': os.path.join(base_dir, 'data/umls/MRSTY.RRF'),
+    'mesh-desc': os.path.join(base_dir, 'data/mesh/desc2017.xml'),
     'extra-topics': os.path.join(base_dir, 'data/extra_topics.xml'),
     'trec_eval': os.path.join(base_dir, 'src/trec_eval'),
     'sample_eval': os.path.join(base_dir, 'src/sample_eval.pl'),
     'rel_file': os.path.join(base_dir, 'data/cosmic_ref/rel_file.cosmic'),
     'rel_file_s': os.path.join(base_dir, 'data/cosmic_ref/rel_file_s.cosmic'),
+    'fixtures': os.path.join(base_dir, 'data/fixtures'),  # check_* commands
 }
 CONF_SOLR = {
+    'url': 'http://localhost:8983/solr',
+    'cores': {'a': 'articles', 't': 'trials'},  # core names by target
+    'pool_size': 10,  # keep-alive connections per core
+    'timeout': 600,   # seconds
+    'query_workers': 4,  # topics queried concurrently (1: one at a time)
     'rows': 1000,  # number of returned rows
-    'fl': '*,score',
+    'fl': 'id,score',  # rankings only; stored fields: runner.py show_docs
+    'wt': 'csv',  # response writer of the rankings ('csv' or 'json')
+    'cache': False,  # cache the responses on disk (PATHS['solr-cache'])
+    'cache_size': 1 << 30,  # bytes of cached responses (lru eviction)
     'umls_qe': ['disease', 'gene'],  # add query expansion on the fields
     'enable_conj_uprank': True,
+    # up-rank conjunctive results in one request per topic (sort by the
+    # conjunctive score), instead of two runs merged by merge_ranked_list
+    'conj_single_pass': True,
     'qe_umls': True,
     'qe_MoD': True,
     'wt_disease': 0.2394,       # wt1
@@ -51,6 +75,79 @@ CONF_SOLR = {
     'wt_multiplier': '^',
 }
 
+CONF_IMPORT = {
+    'batch_docs_max': 5000,  # maximum docs per update request
+    'batch_bytes': 4 << 20,  # initial target payload size of an update
+    'batch_bytes_min': 256 << 10,  # lower/upper bounds of the target size,
+    'batch_bytes_max': 32 << 20,   # which adapts to the solr latency
+    'latency': 2.,       # target seconds per update request
+    'posters': 2,        # number of update requests in flight
+    'queue_depth': 8,    # capacity of the queues between pipeline stages
+    'commit': 'final',   # commit policy: 'final', 'within' or 'every'
+    'commit_within': 60000,  # commitWithin in ms (commit: 'within')
+    'commit_every': 10,  # update requests per hard commit (commit: 'every')
+    'optimize': False,   # optimize instead of the final commit
+    'trial_extractor': 'direct',  # 'direct' or 'xslt' (trials.xsl)
+    'format': 'json',    # update format of the documents: 'json' or 'xml'
+    'gzip': False,       # gzip the update payloads (needs request inflation
+                         # enabled in solr's jetty)
+    'cui_batch': 100,    # articles per metamap call (enrich_cuis)
+}
+
+CONF_EVAL = {
+    # 'native' (measures computed in process, evaluation.py) or 'tools'
+    # (trec_eval and sample_eval executables of PATHS)
+    'evaluator': 'native',
+}
+
+CONF_OPTIMIZE = {
+    # search of the template weights (runner.py optimize_weights)
+    'strategy': 'cmaes',  # 'coordinate', 'cmaes' or 'halving'
+    'workers': 4,        # weight vectors evaluated concurrently (processes)
+    'topics': None,      # topic numbers (None: all of PATHS['q-templates'])
+    'seed': 0,           # same seed, same search (resumed from checkpoint)
+    'budget': 400,       # weight vectors scored (coordinate, cmaes)
+    'step': .5,          # initial step of the coordinate search
+    'sigma': .5,         # initial step size (cmaes), variation (halving)
+    'popsize': 8,        # weight vectors per generation (cmaes)
+    'candidates': 81,    # random weight vectors (halving)
+    'eta': 3,            # 1/eta of the candidates kept per round (halving)
+}
+
+CONF_CONCEPTS = {
+    'ttl': None,                  # seconds; cached lookups never expire
+    'negative_ttl': 7 * 86400,    # seconds to keep failed lookups (None)
+}
+
+CONF_UMLS = {
+    'api_key': '****',
+    # 'rest' (uts and MeSH on Demand web services) or 'local' (thesaurus
+    # index built from the UMLS and MeSH files; runner.py build_thesaurus)
+    'backend': 'rest',
+    'pool_size': 8,      # keep-alive connections (and concurrent lookups)
+    # 'apikey' (api key sent with each request), or 'ticket' as a fallback
+    # for endpoints that still require cas service tickets, which cost
+    # extra round trips per term
+    'auth': 'apikey',
+}
+
+CONF_PREFETCH = {
+    # requests in flight per service (runner.py warm)
+    'umls': 8,
+    'mod': 4,
+    'metamap': 2,        # each request runs a metamap process
+}
+
+CONF_METAMAP = {
+    # 'subprocess' (pymetamap; a metamap process per call), 'server' (pool
+    # of long-lived metamap processes) or 'standin' (no metamap; testing)
+    'backend': 'subprocess',
+    'path': '/opt/public_mm/bin/metamap16',
+    'servers': 2,        # metamap processes of the server backend
+    'timeout': 60,       # seconds without output before a server is
+                         # killed (restarted on the next call)
+}
+
 CONF_MM = {
     'restrict_to_sts': [
         'aapp',  # T116|Amino Acid, Peptide, or Protein|
@@ -64,9 +161,6 @@ CONF_MM = {
     ],
     'silent': True
 }
-CONF_UMLS = {
-    'api_key': '****',
-}
 CONF_MUT_TYPES = {
     'amplification': ["Gene Amplification"],
     'fusion': ["Gene Fusion"],
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+offline thesaurus: UMLS (MRCONSO, MRSTY) and MeSH lookups from a local
+index, with the interfaces of UMLS_api.Client (get_cuis, get_atoms,
+get_concepts) and MOD_api.Client (get_mesh)
+
+The index is a directory of tables built once by build_index(). Each table
+is a file of key-sorted "key\\tvalue\\n" records with a companion file of
+record offsets (.off, 8 bytes each). Both are memory-mapped, so opening the
+index costs nothing and a lookup is a binary search over the page cache:
+
+    - str2cui: normalized string -> CUIs of its atoms (best first)
+    - cui: CUI -> preferred name, semantic types
+    - atoms: CUI -> atoms (name, term type) in the source vocabularies
+    - mesh: normalized MeSH descriptor name or entry term -> headings
+"""
+import os
+import re
+import mmap
+import struct
+import lxml.etree as et
+
+SEP = '\x1f'  # separates the items of a value
+TABLES = ['str2cui', 'cui', 'atoms', 'mesh']
+
+
+def normalize(term):
+    """case and whitespace insensitive key of a term"""
+    return ' '.join(term.lower().split())
+
+
+class Table(object):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = _mmap(f)
+        with open(path + '.off', 'rb') as f:
+            self.offsets = _mmap(f)
+        self.size = len(self.offsets) // 8
+
+    def _record(self, i):
+        start = struct.unpack_from('<Q', self.offsets, i * 8)[0]
+        end = self.data.find(b'\n', start)
+        return self.data[start:end]
+
+    def get(self, key):
+        """value of a key, or None"""
+        key = key.encode()
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, _, v = self._record(mid).partition(b'\t')
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                return v.decode()
+        return None
+
+
+def _mmap(f):
+    if os.fstat(f.fileno()).st_size == 0:
+        return b''  # empty files cannot be mapped
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _write_table(path, records):
+    """write a table from a dict of key -> value (strings)"""
+    items = sorted((k.encode(), v.encode()) for k, v in records.items())
+    with open(path, 'wb') as f, open(path + '.off', 'wb') as off:
+        pos = 0
+        for k, v in items:
+            line = k + b'\t' + v + b'\n'
+            off.write(struct.pack('<Q', pos))
+            f.write(line)
+            pos += len(line)
+
+
+def _clean(s):
+    """strip the separators of the index format from a value"""
+    return re.sub(r"[\t\n\x1f]", ' ', s)
+
+
+def build_index(path, mrconso, mrsty=None, mesh_desc=None, sabs=('NCI',),
+                lang='ENG'):
+    """build the thesaurus index
+
+    :param path: index directory; created if not exists
+    :param mrconso: MRCONSO.RRF of a UMLS release
+    :param mrsty: MRSTY.RRF (semantic types); optional
+    :param mesh_desc: MeSH descriptor xml (ex. desc2017.xml); optional
+    :param sabs: source vocabularies of the atoms (UMLS_api uses NCI)
+    :param lang: language of the atoms
+    :return: number of records per table
+    """
+    os.makedirs(path, exist_ok=True)
+    sabs = set(sabs)
+
+    # - pass 1: atoms of the source vocabularies
+    str2cui = dict()  # normalized string -> {cui: rank}
+    atoms = dict()  # cui -> [(name, tty)]
+    with open(mrconso, encoding='utf-8') as f:
+        for line in f:
+            r = line.rstrip('\n').split('|')
+            # CUI|LAT|TS|LUI|STT|SUI|ISPREF|AUI|SAUI|SCUI|SDUI|SAB|TTY|CODE|
+            # STR|SRL|SUPPRESS|CVF
+            if r[1] != lang or r[11] not in sabs or r[16] not in ['N', '']:
+                continue
+            cui, name = r[0], _clean(r[14])
+            # rank the concepts of a string by the preference of the atom
+            rank = 0 if r[12] == 'PT' else 1 if r[6] == 'Y' else 2
+            cuis = str2cui.setdefault(normalize(name), dict())
+            cuis[cui] = min(rank, cuis.get(cui, rank))
+            atoms.setdefault(cui, []).append((name, r[12]))
+
+    # - pass 2: preferred names of the concepts (in any vocabulary)
+    names = dict()
+    with open(mrconso, encoding='utf-8') as f:
+        for line in f:
+            r = line.rstrip('\n').split('|')
+            if r[0] in atoms and r[0] not in names and r[1] == lang and \
+                    r[2] == 'P' and r[4] == 'PF' and r[6] == 'Y':
+                names[r[0]] = _clean(r[14])
+
+    semtypes = dict()
+    if mrsty is not None:
+        with open(mrsty, encoding='utf-8') as f:
+            for line in f:
+                # CUI|TUI|STN|STY|ATUI|CVF
+                r = line.rstrip('\n').split('|')
+                if r[0] in atoms:
+                    semtypes.setdefault(r[0], []).append(r[3])
+
+    mesh = dict()  # normalized term -> headings
+    if mesh_desc is not None:
+        for _, rec in et.iterparse(mesh_desc, tag='DescriptorRecord'):
+            heading = _clean(rec.findtext('DescriptorName/String'))
+            terms = [heading] + [t.text for t in rec.iterfind(
+                'ConceptList/Concept/TermList/Term/String')]
+            for t in terms:
+                headings = mesh.setdefault(normalize(t), [])
+                if heading not in headings:
+                    headings.append(heading)
+            rec.clear()
+
+    tables = {
+        'str2cui': {s: SEP.join(sorted(c, key=lambda x: (c[x], x)))
+                    for s, c in str2cui.items()},
+        'cui': {c: names.get(c, a[0][0]) + '\t' +
+                SEP.join(semtypes.get(c, [])) for c, a in atoms.items()},
+        'atoms': {c: SEP.join(n + '|' + tty for n, tty in a)
+                  for c, a in atoms.items()},
+        'mesh': {t: SEP.join(h) for t, h in mesh.items()},
+    }
+    for name, records in tables.items():
+        _write_table(os.path.join(path, name), records)
+    return {name: len(records) for name, records in tables.items()}
+
+
+class Client(object):
+    def __init__(self, path, max_results=5):
+        """
+        :param path: index directory (build_index)
+        :param max_results: number of concepts of a search (pageSize)
+        """
+        self.tables = {t: Table(os.path.join(path, t)) for t in TABLES}
+        self.max_results = max_results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def get_cuis(self, term, sts=None):
+        """concepts of a term, like the search result of the uts rest api:
+        {'results': [{'ui': cui, 'name': preferred name}, ...]}, or a single
+        'NONE' result if the term is not found"""
+        cuis = self.tables['str2cui'].get(normalize(term))
+        if cuis is None:
+            return {'results': [{'ui': 'NONE', 'name': 'NO RESULTS'}]}
+        results = []
+        for cui in cuis.split(SEP)[:self.max_results]:
+            name, _, _ = self.tables['cui'].get(cui).partition('\t')
+            results.append({'ui': cui, 'name': name})
+        return {'results': results}
+
+    def get_atoms(self, cui):
+        """atoms of a concept [{'name': .., 'termType': ..}], or None"""
+        atoms = self.tables['atoms'].get(cui)
+        if atoms is None:
+            return None
+        return [dict(zip(['name', 'termType'], a.rsplit('|', 1)))
+                for a in atoms.split(SEP)]
+
+    def get_semantic_types(self, cui):
+        """names of the semantic types of a concept (MRSTY)"""
+        info = self.tables['cui'].get(cui)
+        if info is None:
+            return []
+        sty = info.partition('\t')[2]
+        return sty.split(SEP) if sty else []
+
+    def get_concepts(self, terms):
+        """see UMLS_api.Client.get_concepts"""
+        results = dict()
+        for term in terms:
+            cuis = self.get_cuis(term)
+            results[term] = (cuis, self.get_atoms(cuis['results'][0]['ui']))
+        return results
+
+    def get_mesh(self, q_str):
+        """MeSH headings found in a text, like MeSH on Demand: the longest
+        word sequences matching a descriptor name or entry term"""
+        tokens = normalize(q_str).split()
+        found = []
+        i = 0
+        while i < len(tokens):
+            for j in range(len(tokens), i, -1):
+                headings = self.tables['mesh'].get(' '.join(tokens[i:j]))
+                if headings is not None:
+                    found.extend(h for h in headings.split(SEP)
+                                 if h not in found)
+                    i = j
+                    break
+            else:
+                i += 1
+        return found
@@ -12,21 +12,21 @@ from __future__ import print_function
 import os
 import sys
 import argparse
-from time import gmtime, strftime
-from nltk.corpus import stopwords
+from time import gmtime, strftime, time
 import re
 import itertools
+import lxml.etree as et
 from copy import deepcopy
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 from config import config as cfg
-from Trec2017pm import logger, solr, utils
+from Trec2017pm import logger, solr, utils, metamap
 from umls_api import UMLS_api
+from local_api import LOCAL_api
 import random
 from collections import OrderedDict
 
 
-stopwords = stopwords.words('english')
 extra_stopwords = ['gene']
 
 def update_obj(dst, src):
@@ -93,18 +93,7 @@ def _run_exp_11():
     resdir = os.path.join(cfg.PATHS['vardir'], 'res-'+dt)
     os.mkdir(resdir)
 
-    # run default quries
-    cfg.CONF_SOLR['enable_conj_uprank'] = False
-    queries_articles = utils.parse_topics(cfg.PATHS['topics'], target)
-    solr.run_queries(queries_articles, resdir, target=target)
-
-    # run conjunctive
-    cfg.CONF_SOLR['enable_conj_uprank'] = True
-    queries_articles = utils.parse_topics(cfg.PATHS['topics'], target)
-    solr.run_queries(queries_articles, resdir, target=target)
-
-    # merge two ranked lists: up-ranked the one of conjunctive
-    merge_ranked_list(resdir)
+    _run_conj_uprank(resdir, target)
 
     # run evaluators
     if cfg.evaluate and target == 'a':
@@ -118,17 +107,7 @@ def _run_exp_trial():
     resdir = os.path.join(cfg.PATHS['vardir'], 'res-'+dt)
     os.mkdir(resdir)
 
-    cfg.CONF_SOLR['enable_conj_uprank'] = False
-    queries_articles = utils.parse_topics(cfg.PATHS['topics'], target)
-    solr.run_queries(queries_articles, resdir, target=target)
-
-    # run conjunctive
-    cfg.CONF_SOLR['enable_conj_uprank'] = True
-    queries_articles = utils.parse_topics(cfg.PATHS['topics'], target)
-    solr.run_queries(queries_articles, resdir, target=target)
-
-    # merge two ranked lists: up-ranked the one of conjunctive
-    merge_ranked_list(resdir, target=target)
+    _run_conj_uprank(resdir, target)
 
     # run evaluators
     if cfg.evaluate and target == 'a':
@@ -186,22 +165,35 @@ def _run_exp_14():
     resdir = os.path.join(cfg.PATHS['vardir'], 'res-'+dt)
     os.mkdir(resdir)
 
+    _run_conj_uprank(resdir, target)
+
+    # run evaluators
+    if cfg.evaluate and target == 'a':
+        utils.run_evaluators(resdir)
+
+
+def _run_conj_uprank(resdir, target):
+    """run the topics with the conjunctive results up-ranked into
+    top_articles.out (top_trials.out); in one request per topic
+    (CONF_SOLR['conj_single_pass']), or in two runs merged by
+    merge_ranked_list"""
+    if cfg.CONF_SOLR['conj_single_pass']:
+        queries = utils.parse_topics_conj(cfg.PATHS['topics'], target)
+        solr.run_queries(queries, resdir, target=target)
+        return
+
     # run default quries
     cfg.CONF_SOLR['enable_conj_uprank'] = False
-    queries_articles = utils.parse_topics(cfg.PATHS['topics'], 'a')
-    solr.run_queries(queries_articles, resdir, target='a')
+    queries = utils.parse_topics(cfg.PATHS['topics'], target)
+    solr.run_queries(queries, resdir, target=target)
 
     # run conjunctive
     cfg.CONF_SOLR['enable_conj_uprank'] = True
-    queries_articles = utils.parse_topics(cfg.PATHS['topics'], 'a')
-    solr.run_queries(queries_articles, resdir, target='a')
+    queries = utils.parse_topics(cfg.PATHS['topics'], target)
+    solr.run_queries(queries, resdir, target=target)
 
     # merge two ranked lists: up-ranked the one of conjunctive
-    merge_ranked_list(resdir)
-
-    # run evaluators
-    if cfg.evaluate and target == 'a':
-        utils.run_evaluators(resdir)
+    merge_ranked_list(resdir, target=target)
 
 
 def merge_ranked_list(resdir, target='a'):
@@ -262,6 +254,74 @@ def merge_ranked_list(resdir, target='a'):
                 pos += 1
 
 
+def _read_rankings(file):
+    """rankings by topic of a result file, as the groups of documents of
+    equal score, since the order of ties is arbitrary: [{ids}, ...]"""
+    rankings = dict()
+    with open(file) as f:
+        for line in f:
+            q_id, _, doc_id, pos, score, _ = line.split()
+            rankings.setdefault(int(q_id), []).append(
+                (int(pos), round(float(score), 6), doc_id))
+    for q, ranked in rankings.items():
+        groups, last = [], None
+        for _, score, doc_id in sorted(ranked):
+            if score != last:
+                groups.append(set())
+                last = score
+            groups[-1].add(doc_id)
+        rankings[q] = groups
+    return rankings
+
+
+def _same_ranking(a, b):
+    """same groups of ties, except for the members of the last group which
+    may be cut at different documents"""
+    return len(a) == len(b) and a[:-1] == b[:-1]
+
+
+def _run_check_conj(target='a'):
+    """run the topics with the single pass conjunctive up-rank and with two
+    runs merged by merge_ranked_list, and compare the rankings (up to the
+    order of documents of equal score)
+
+    :return: True if the rankings of all topics are the same
+    """
+    dt = strftime("%m%d%H%M%s", gmtime())  # datetime as an exp id
+    resdir = os.path.join(cfg.PATHS['vardir'], 'res-check_conj-'+dt)
+    top_file = 'top_articles.out' if target == 'a' else 'top_trials.out'
+    rankings = dict()
+    single_pass = cfg.CONF_SOLR['conj_single_pass']
+    try:
+        for mode in [False, True]:
+            mode_dir = os.path.join(resdir, 'single' if mode else 'merge')
+            os.makedirs(mode_dir)
+            cfg.CONF_SOLR['conj_single_pass'] = mode
+            _run_conj_uprank(mode_dir, target)
+            rankings[mode] = _read_rankings(os.path.join(mode_dir, top_file))
+    finally:
+        cfg.CONF_SOLR['conj_single_pass'] = single_pass
+
+    topics = sorted(set(rankings[False]) | set(rankings[True]))
+    diff = [q for q in topics
+            if not _same_ranking(rankings[False].get(q, []),
+                                 rankings[True].get(q, []))]
+    for q in diff:
+        merged, single = rankings[False].get(q, []), rankings[True].get(q, [])
+        pos = next((i for i, (a, b) in enumerate(zip(merged, single))
+                    if a != b), min(len(merged), len(single)))
+        logger.log('ERROR', 'topic #{}: rankings differ from the score group '
+                   '{} ({} vs. {} groups)'.format(q, pos, len(merged),
+                                                  len(single)),
+                   printout=True)
+    logger.log('INFO' if len(diff) == 0 else 'ERROR',
+               '{} of {} topics ranked the same in a single pass and by '
+               'merge_ranked_list [{}]'.format(len(topics) - len(diff),
+                                               len(topics), resdir),
+               printout=True)
+    return len(diff) == 0
+
+
 def _run_exp_optimize_weights():
     """ ! do not delete this run
     we have 5 query clauses; disease, gene, variant, demographics, others
@@ -361,20 +421,444 @@ def _run_exp_optimize_weights():
                printout=True)
     logger.log('INFO', "best_score: {}".format(best_score), printout=True)
 
+
+def _run_exp_optimize_offline(batches=20, batch_size=1000):
+    """_run_exp_optimize_weights on the clause scores of the candidate
+    documents (rescore.py): the scores are extracted from solr once, weight
+    vectors are evaluated (map) offline in batches, and only the best
+    weights are run on solr and evaluated; the templates are those of
+    PATHS['q-templates'] (topics CONF_OPTIMIZE['topics'], like
+    optimize_weights)
+
+    :param batches: number of batches of weight vectors
+    :param batch_size: weight vectors per batch
+    """
+    import numpy as np
+    from Trec2017pm import optimize, rescore
+    target = 'a'
+    templates = optimize.load_templates(cfg.PATHS['q-templates'],
+                                        cfg.CONF_OPTIMIZE['topics'])
+    q_no = sorted(templates)
+    dt = strftime("%m%d%H%M%s", gmtime())  # datetime as an exp id
+    resdir = os.path.join(cfg.PATHS['vardir'], 'res-'+dt)
+    os.mkdir(resdir)
+
+    # clause scores; extracted again when the index has changed
+    features_file = cfg.PATHS['features']
+    features = None
+    if os.path.exists(features_file):
+        features = rescore.FeatureCache.load(features_file)
+        if features.version != solr._index_version(target) or \
+                features.topics != q_no:
+            features = None
+    if features is None:
+        features = solr.extract_features(templates, target)
+        features.save(features_file)
+        logger.log('INFO', 'clause scores saved [{}]'.format(features_file),
+                   printout=True)
+    rel, num_rel = features.relevance(
+        rescore.load_qrels(cfg.PATHS['rel_file']))
+    rows = cfg.CONF_SOLR['rows']
+
+    # same moves as _run_exp_optimize_weights (weights / 100): totally
+    # random weights, larger and small variations of the best weights
+    rng = np.random.default_rng()
+    best = np.array([cfg.CONF_SOLR['wt_' + c] for c in rescore.CLAUSES])
+    best_score = features.average_precision(best, rel, num_rel, rows)[0]
+    variation = .05
+    t0 = time()
+    for i in range(batches):
+        n = batch_size // 3
+        candidates = np.vstack([
+            rng.uniform(0, 3, (n, len(best))),
+            np.maximum(0, rng.normal(best, variation * 10, (n, len(best)))),
+            np.maximum(0, rng.normal(best, variation,
+                                     (batch_size - 2 * n, len(best))))])
+        scores = features.average_precision(candidates, rel, num_rel, rows)
+        if scores.max() > best_score:
+            best, best_score = candidates[scores.argmax()], scores.max()
+            logger.log('INFO', 'batch #{}: map {:.4f}'.format(i+1, best_score),
+                       printout=True)
+    elapsed = time() - t0
+    logger.log('INFO', '{} weight vectors evaluated offline in {:.1f}s ({:.0f}'
+               '/s)'.format(batches * batch_size, elapsed,
+                            batches * batch_size / elapsed), printout=True)
+    logger.log('INFO', "best_weights: {}".format(
+        ', '.join([str(round(x, 6)) for x in best])), printout=True)
+    logger.log('INFO', "best_score (offline map): {:.4f}".format(best_score),
+               printout=True)
+
+    # confirm the best weights on solr (the templates have the conjunctive
+    # clause, so the results are the final top_articles.out)
+    cfg.CONF_SOLR['enable_conj_uprank'] = False
+    queries = [{'query': rescore.fill_template(templates[i], best)}
+               for i in q_no]
+    solr.run_queries(queries, resdir, target=target, q_no=q_no)
+    if cfg.evaluate:
+        utils.run_evaluators(resdir)
+
+
+def _run_optimize_weights(strategy=None, topics=None):
+    """search the weights of the query templates on solr, evaluating batches
+    of weight vectors concurrently (optimize.py); a search of the same seed
+    is resumed from the checkpoint (PATHS['optimize-checkpoint'])
+
+    :param strategy: search strategy (default: CONF_OPTIMIZE['strategy'])
+    :param topics: topic numbers (default: CONF_OPTIMIZE['topics'])
+    :return: best weights and their score
+    """
+    import numpy as np
+    from Trec2017pm import optimize, rescore
+    conf = cfg.CONF_OPTIMIZE
+    strategy = strategy or conf['strategy']
+    target = 'a'
+    templates = optimize.load_templates(cfg.PATHS['q-templates'],
+                                        topics or conf['topics'])
+    params = {'coordinate': ['step', 'budget'],
+              'cmaes': ['sigma', 'popsize', 'budget'],
+              'halving': ['candidates', 'eta', 'sigma']}[strategy]
+    rng = np.random.default_rng(conf['seed'])
+    x0 = [cfg.CONF_SOLR['wt_' + c] for c in rescore.CLAUSES]
+    logger.log('INFO', '{} search of the weights on {} topics ({} workers)'.
+               format(strategy, len(templates), conf['workers']),
+               printout=True)
+    t0 = time()
+    with optimize.WeightSearch(templates, target, conf['workers'],
+                               cfg.PATHS['optimize-checkpoint'],
+                               solr._index_version(target)) as search:
+        best, best_score = optimize.STRATEGIES[strategy](
+            search, x0, rng, **{k: conf[k] for k in params})
+    logger.log('INFO', '{} queries run in {:.1f}s, {} from the checkpoint'.
+               format(search.num_evaluated, time() - t0, search.num_memo),
+               printout=True)
+    logger.log('INFO', "best_weights: {}".format(
+        ', '.join([str(round(x, 6)) for x in best])), printout=True)
+    logger.log('INFO', "best_score: {:.4f}".format(best_score), printout=True)
+    return best, best_score
+
+
+def _run_check_medline():
+    """compare the streaming medline extractor with articles.xsl on the
+    articles of PATHS['fixtures'] (medline/): inline markup, several
+    AbstractText, articles without an Article element, a book article
+
+    :return: True if both give the same fields for all the articles
+    """
+    from Trec2017pm import sources
+    doc_files = sorted(sources.list_sources(
+        os.path.join(cfg.PATHS['fixtures'], 'medline'), r"part[1-5]", 'xml'))
+    mismatches, count = solr.compare_medline_fields(doc_files)
+    logger.log('INFO' if mismatches == 0 else 'ERROR',
+               '{} of {} articles have the same fields by articles.xsl and '
+               'the streaming extractor'.format(count - mismatches, count),
+               printout=True)
+    return mismatches == 0 and count > 0
+
+
+def _run_check_trials():
+    """compare the direct trial extractor with trials.xsl on the trials of
+    PATHS['fixtures'] (trials/): unknown study_design_info children, several
+    interventions, missing, empty and N/A ages, ages in minutes and hours
+
+    :return: True if both give the same fields for all the trials
+    """
+    from Trec2017pm import sources
+    trial_files = sorted(sources.list_sources(
+        os.path.join(cfg.PATHS['fixtures'], 'trials'), r"\d+", 'xml'))
+    mismatches = solr.compare_trial_fields(trial_files)
+    logger.log('INFO' if mismatches == 0 else 'ERROR',
+               '{} of {} trials have the same fields by trials.xsl and the '
+               'direct extractor'.format(len(trial_files) - mismatches,
+                                         len(trial_files)),
+               printout=True)
+    return mismatches == 0 and len(trial_files) > 0
+
+
+def _run_show_docs(run_file, target='a', top=10, fl='*', width=120):
+    """print the stored fields of the top documents of a result file, which
+    holds the rankings only (CONF_SOLR['fl'])
+
+    :param run_file: result file (trec format)
+    :param top: documents per topic; only the topic cfg.topic if given
+    :param fl: fields to fetch (solr.fetch_docs)
+    :param width: values are cut to this many characters
+    """
+    from Trec2017pm import evaluation
+    rankings = evaluation.read_run(run_file)
+    if cfg.topic:
+        rankings = {t: r for t, r in rankings.items() if t == int(cfg.topic)}
+    ids = sorted(set(d for r in rankings.values() for d in r[:top]))
+    docs = solr.fetch_docs(target, ids, fl)
+    for t in sorted(rankings):
+        print('topic #{}'.format(t))
+        for rank, doc_id in enumerate(rankings[t][:top]):
+            doc = docs.get(doc_id)
+            print('{:5d} {}{}'.format(rank+1, doc_id,
+                                      '' if doc else ' (not found)'))
+            for name, value in sorted((doc or {}).items()):
+                if name == 'id' or name.startswith('_'):
+                    continue
+                value = str(value)
+                if len(value) > width:
+                    value = value[:width-3] + '...'
+                print('      {}: {}'.format(name, value))
+    logger.log('INFO', '{} of {} documents found on core {}'.format(
+        len(docs), len(ids), cfg.CONF_SOLR['cores'][target]), printout=True)
+
+
+def _run_check_thesaurus():
+    """build the thesaurus index of the synthetic UMLS and MeSH files of
+    PATHS['fixtures'] (thesaurus/), and check its lookups, directly and by
+    the umls and MeSH lookups of utils with the 'local' backend
+
+    :return: True if all the lookups give the expected results
+    """
+    import tempfile
+    src = os.path.join(cfg.PATHS['fixtures'], 'thesaurus')
+    path = tempfile.mkdtemp(prefix='thesaurus-')
+    counts = LOCAL_api.build_index(
+        path, os.path.join(src, 'MRCONSO.RRF'),
+        mrsty=os.path.join(src, 'MRSTY.RRF'),
+        mesh_desc=os.path.join(src, 'desc.xml'))
+    client = LOCAL_api.Client(path)
+    melanoma = {'results': [{'ui': 'C0025202', 'name': 'Melanoma'},
+                            {'ui': 'C1335280', 'name': 'Melanocytic Lesion'}]}
+    none = {'results': [{'ui': 'NONE', 'name': 'NO RESULTS'}]}
+    checks = [
+        # preferred term first, then the other concepts of the string
+        ('get_cuis melanoma', client.get_cuis('Melanoma'), melanoma),
+        ('get_cuis normalized', client.get_cuis(' malignant  MELANOMA'),
+         {'results': [{'ui': 'C0025202', 'name': 'Melanoma'}]}),
+        # suppressed and non english atoms are not indexed
+        ('get_cuis suppressed', client.get_cuis('melanoma, malignant'), none),
+        ('get_cuis other language', client.get_cuis('Mélanome'), none),
+        ('get_cuis unknown', client.get_cuis('xyz'), none),
+        ('get_atoms', client.get_atoms('C0812241'),
+         [{'name': 'BRAF Gene', 'termType': 'PT'},
+          {'name': 'BRAF', 'termType': 'SY'},
+          {'name': 'B-RAF1', 'termType': 'SY'}]),
+        ('get_atoms other source', client.get_atoms('C0037286'), None),
+        ('semantic types', client.get_semantic_types('C0812241'),
+         ['Gene or Genome', 'Amino Acid, Peptide, or Protein']),
+        ('semantic types none', client.get_semantic_types('C0000000'), []),
+        # the longest matching term: skin neoplasms, not skin
+        ('get_mesh longest match', client.get_mesh('Skin Neoplasms'),
+         ['Skin Neoplasms']),
+        ('get_mesh entry terms',
+         client.get_mesh('BRAF protein in a malignant melanoma of the skin'),
+         ['Proto-Oncogene Proteins B-raf', 'Melanoma', 'Skin']),
+        ('get_mesh none', client.get_mesh('nothing here'), []),
+    ]
+    backend, thesaurus = cfg.CONF_UMLS['backend'], cfg.PATHS['thesaurus']
+    try:
+        cfg.CONF_UMLS['backend'], cfg.PATHS['thesaurus'] = 'local', path
+        utils._local_client = None
+        checks += [
+            ('utils.umls_search', utils.umls_search('melanoma'), melanoma),
+            ('utils.umls_atoms', utils.umls_atoms('C0025202'),
+             [{'name': 'Melanoma', 'termType': 'PT'},
+              {'name': 'Malignant Melanoma', 'termType': 'SY'}]),
+            ('utils.mod_mesh', utils.mod_mesh('skin cancer'),
+             ['Skin Neoplasms']),
+        ]
+    finally:
+        cfg.CONF_UMLS['backend'], cfg.PATHS['thesaurus'] = backend, thesaurus
+        utils._local_client = None
+    failed = [(name, value, expected) for name, value, expected in checks
+              if value != expected]
+    for name, value, expected in failed:
+        logger.log('ERROR', '{}: {} (expected {})'.format(name, value,
+                                                          expected),
+                   printout=True)
+    logger.log('INFO' if len(failed) == 0 else 'ERROR',
+               '{} of {} thesaurus lookups as expected; index {} [{}]'.
+               format(len(checks) - len(failed), len(checks), counts, path),
+               printout=True)
+    return len(failed) == 0
+
+
+def _parse_eval_output(output):
+    """values of a trec_eval -q (or sample_eval -q) output by (measure,
+    topic); topics are numbers or 'all'"""
+    values = dict()
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) != 3:
+            continue
+        m, topic, value = fields
+        try:
+            values[(m, topic if topic == 'all' else int(topic))] = \
+                float(value)
+        except ValueError:
+            continue  # runid, etc.
+    return values
+
+
+def _run_check_eval(run_file=None, tol=1e-4):
+    """evaluate a run file in process and with trec_eval and sample_eval,
+    and compare the values of the measures computed by both
+
+    Without a run file, the fixture runs of PATHS['fixtures'] are evaluated
+    and compared with the reference outputs stored with them, so the tools
+    are not needed:
+
+        - eval/: run.trec_eval is the trec_eval -q output of the run; the
+          sample qrels are complete judgments, where inferred AP and NDCG
+          are AP and NDCG, so run.sample_eval holds the map and ndcg of
+          trec_eval on them
+        - eval_sampled/: stratified samples (p < 1, unsampled documents),
+          with the infAP and infNDCG of run.sample_eval computed by hand
+          (see its README)
+
+    :param tol: maximum difference of the values (the tools print 4
+        decimals)
+    :return: True if all the values agree
+    """
+    if run_file is None:
+        ok = True
+        for name in ['eval', 'eval_sampled']:
+            fixtures = os.path.join(cfg.PATHS['fixtures'], name)
+            run = os.path.join(fixtures, 'run')
+            result = utils.evaluate_run(run,
+                                        os.path.join(fixtures, 'qrels'),
+                                        os.path.join(fixtures, 'qrels_s'))
+            output = ''
+            if os.path.isfile(run + '.trec_eval'):
+                with open(run + '.trec_eval') as f:
+                    output = f.read()
+            with open(run + '.sample_eval') as f:
+                output_s = f.read()
+            ok = _compare_eval(run, result, output, output_s, tol) and ok
+        return ok
+    result = utils.evaluate_run(run_file)
+    output, output_s = utils.run_eval_tools(run_file, measures=['all_trec'])
+    return _compare_eval(run_file, result, output, output_s, tol)
+
+
+def _compare_eval(run_file, result, output, output_s, tol):
+    """compare the in process measures of a run with the outputs of
+    trec_eval and sample_eval
+
+    :return: True if all the values agree
+    """
+    reference = _parse_eval_output(output)
+    # measures of sample_eval are prefixed with 's_' in the result
+    reference.update({('s_' + m, t): v for (m, t), v in
+                      _parse_eval_output(output_s).items()})
+    compared, diff = 0, []
+    for (m, t), v in sorted(reference.items(), key=str):
+        if m in result and t in result[m]:
+            compared += 1
+            if abs(result[m][t] - v) > tol:
+                diff.append((m, t, result[m][t], v))
+    for m, t, v, ref in diff[:20]:
+        logger.log('ERROR', '{} of topic {}: {:.4f} (reference {:.4f})'.
+                   format(m, t, v, ref), printout=True)
+    ok = compared > 0 and len(diff) == 0
+    logger.log('INFO' if ok else 'ERROR',
+               '{} of {} values agree with trec_eval and sample_eval [{}]'.
+               format(compared - len(diff), compared, run_file),
+               printout=True)
+    return ok
+
+
+# dependencies loaded on first use only, never at startup
+LAZY_MODULES = ['nltk', 'twilio', 'pymetamap', 'pyquery']
+
+
+def _run_bench_startup(repeat=5, budget=1.):
+    """measure the startup (import) time of the runner in fresh interpreters,
+    and check that none of LAZY_MODULES is loaded at startup
+
+    :param repeat: number of interpreters to measure
+    :param budget: maximum seconds of the median startup time
+    :return: True if the startup is within the budget and lazy
+    """
+    import subprocess
+    code = ("import sys, time; t0 = time.time(); sys.path.insert(0, {!r}); "
+            "import runner; print(time.time() - t0); "
+            "print(' '.join(m for m in {!r} if m in sys.modules))"
+            "".format(os.path.dirname(os.path.abspath(__file__)),
+                      LAZY_MODULES))
+    times = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', code],
+                                      universal_newlines=True).splitlines()
+        times.append(float(out[0]))
+        loaded = out[1].split() if len(out) > 1 else []
+    median = sorted(times)[len(times) // 2]
+    ok = median <= budget and len(loaded) == 0
+    logger.log('INFO' if ok else 'ERROR',
+               'startup {:.3f}s (median of {}, budget {:.1f}s), eagerly '
+               'loaded: {}'.format(median, repeat, budget,
+                                   ', '.join(loaded) or 'none'),
+               printout=True)
+    return ok
+
+
 if __name__ == '__main__':
     # parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("command", help="run different tasks",
                         choices=['import_docs', 'import_trials',
-                                 'import_extra', 'experiment'])
+                                 'import_extra', 'enrich_cuis', 'warm',
+                                 'build_thesaurus', 'bench_metamap',
+                                 'bench_startup', 'check_conj',
+                                 'check_eval', 'check_thesaurus',
+                                 'check_medline', 'check_trials',
+                                 'optimize_weights', 'show_docs',
+                                 'experiment', 'bench_trials',
+                                 'bench_formats'])
     parser.add_argument("-s", "--sms", action="store_true",
                         help="send sms notification with progress status")
-    parser.add_argument("--skip_files", help="skip files already imported")
+    parser.add_argument("--skip_files",
+                        help="journal of imported files; files recorded in "
+                             "it are skipped and new ones are appended")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of worker processes for transforming "
+                             "source files on import")
+    parser.add_argument("--stream", action="store_true",
+                        help="parse medline files incrementally with bounded "
+                             "memory instead of the whole-file xslt")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="import_trials: post only new/changed trials and "
+                             "delete removed ones, by the trials index")
+    parser.add_argument("--commit", choices=['final', 'within', 'every'],
+                        help="solr commit policy on import (default: "
+                             "CONF_IMPORT['commit'])")
+    parser.add_argument("--optimize", action="store_true",
+                        help="optimize the index at the end of an import")
     parser.add_argument("-e", "--evaluate", action="store_true",
                         help="evaluate wrt. cosmic pubmed ref list")
     parser.add_argument("-t", "--topic", help="specify topic to query")
+    parser.add_argument("--target", choices=['a', 't'], default='a',
+                        help="check_conj: core of the rankings to compare; "
+                             "show_docs: core of the result file")
+    parser.add_argument("--run",
+                        help="check_eval: run file (trec format) to evaluate "
+                             "with the tools (default: the fixture run and "
+                             "its reference outputs); show_docs: result file "
+                             "to show the documents of")
+    parser.add_argument("--top", type=int, default=10,
+                        help="show_docs: documents per topic")
+    parser.add_argument("--fl", default='*',
+                        help="show_docs: stored fields to show (default: all)")
+    parser.add_argument("--strategy",
+                        choices=['coordinate', 'cmaes', 'halving'],
+                        help="optimize_weights: search strategy (default: "
+                             "CONF_OPTIMIZE['strategy'])")
+    parser.add_argument("--topics", nargs='+', type=int,
+                        help="optimize_weights: topics to evaluate the "
+                             "weights on (default: CONF_OPTIMIZE['topics'])")
+    parser.add_argument("--topic_files", nargs='+',
+                        help="warm: topic files to prefetch the expansions "
+                             "of (default: topics and extra-topics)")
     args = parser.parse_args()
     update_obj(cfg, vars(args))
+    if args.commit:
+        cfg.CONF_IMPORT['commit'] = args.commit
+    if args.optimize:
+        cfg.CONF_IMPORT['optimize'] = True
 
     # initialize logger, solr
     logger = logger.Logger()
@@ -387,8 +871,60 @@ if __name__ == '__main__':
         solr.run_import_trials()
     elif args.command == 'import_extra':
         solr.run_import_extra()
+    elif args.command == 'enrich_cuis':
+        solr.run_enrich_cuis()
+    elif args.command == 'warm':
+        topic_files = args.topic_files or \
+            [f for f in [cfg.PATHS['topics'], cfg.PATHS['extra-topics']]
+             if os.path.isfile(f)]
+        utils.prefetch_topics(topic_files)
+    elif args.command == 'build_thesaurus':
+        mrsty, mesh_desc = cfg.PATHS['umls-mrsty'], cfg.PATHS['mesh-desc']
+        counts = LOCAL_api.build_index(
+            cfg.PATHS['thesaurus'], cfg.PATHS['umls-mrconso'],
+            mrsty=mrsty if os.path.isfile(mrsty) else None,
+            mesh_desc=mesh_desc if os.path.isfile(mesh_desc) else None)
+        logger.log('INFO', 'thesaurus index built in {}: {}'.
+                   format(cfg.PATHS['thesaurus'], counts), printout=True)
+    elif args.command == 'bench_startup':
+        if not _run_bench_startup():
+            sys.exit(1)
+    elif args.command == 'check_conj':
+        if not _run_check_conj(args.target):
+            sys.exit(1)
+    elif args.command == 'check_eval':
+        if not _run_check_eval(args.run):
+            sys.exit(1)
+    elif args.command == 'check_thesaurus':
+        if not _run_check_thesaurus():
+            sys.exit(1)
+    elif args.command == 'check_medline':
+        if not _run_check_medline():
+            sys.exit(1)
+    elif args.command == 'check_trials':
+        if not _run_check_trials():
+            sys.exit(1)
+    elif args.command == 'optimize_weights':
+        _run_optimize_weights(args.strategy, args.topics)
+    elif args.command == 'show_docs':
+        if not args.run:
+            parser.error('show_docs requires --run')
+        _run_show_docs(args.run, args.target, args.top, args.fl)
+    elif args.command == 'bench_metamap':
+        # simulated metamap costs (stand-in); per phrase vs. batched calls
+        phrases = [t.text for t in et.parse(cfg.PATHS['topics']).iterfind(
+            './/topic/disease')]
+        t_single, t_batch = metamap.bench(phrases, startup=1.)
+        logger.log('INFO', '{} phrases: {:.2f}s by a call per phrase, {:.2f}s '
+                           'batched'.format(len(phrases), t_single, t_batch),
+                   printout=True)
+    elif args.command == 'bench_trials':
+        solr.run_bench_trials()
+    elif args.command == 'bench_formats':
+        solr.run_bench_formats()
     elif args.command == 'experiment':
         # _run_exp_optimize_weights()
+        # _run_exp_optimize_offline()
         _run_exp_trial()
         # _run_exp_uprank()
         # _run_exp_11()
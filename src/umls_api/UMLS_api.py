@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from pyquery import PyQuery as pq
+from requests.adapters import HTTPAdapter
 import json
 
 
@@ -15,12 +18,50 @@ endpoint = {
     'search': uri_search + "/rest/search/" + service_version,
     'content': uri_search + "/rest/content/" + service_version
 }
+# a tgt is valid for 8 hours; renew it a while before
+tgt_lifetime = 7 * 3600
+
+# client shared in the process (get_client)
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client(**kwargs):
+    """long-lived client of the current process; one tgt and one pool of
+    keep-alive connections for all lookups
+
+    :param kwargs: arguments of the client, when it is created
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = Client(**kwargs)
+        return _client
 
 
 class Client(object):
-    def __init__(self):
+    def __init__(self, pool_size=8, auth='apikey'):
+        """
+        :param pool_size: number of keep-alive connections per host, which
+            also bounds the concurrent requests of get_concepts
+        :param auth: 'apikey' to send the api key with each request (no
+            extra round trips, supported by the current uts rest api), or
+            'ticket' for a service ticket per request (cas) as a fallback
+        """
+        assert auth in ['ticket', 'apikey'], "auth method is undefined"
+        self.auth = auth
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
         # get the URL for POST calls from the auth endpoint
-        self.tgt = self.get_tgt(apikey)
+        self.tgt = None
+        self.tgt_time = 0
+        if auth == 'ticket':
+            self.renew_tgt()
 
     def __enter__(self):
         return self
@@ -35,35 +76,57 @@ class Client(object):
             "Content-type": "application/x-www-form-urlencoded",
             "Accept": "text/plain",
             "User-Agent": "python"}
-        r = requests.post(endpoint['auth'], data=params, headers=h)
+        from pyquery import PyQuery as pq
+        r = self.session.post(endpoint['auth'], data=params, headers=h)
         d = pq(r.text)
         tgt = d.find('form').attr('action')
         if tgt is None:
             raise SystemError("failed to authenticate")
         return tgt
 
+    def renew_tgt(self, expired=None):
+        """get a new tgt, unless another thread has already replaced the
+        expired one"""
+        with self._lock:
+            if expired is None or self.tgt == expired:
+                self.tgt = self.get_tgt(apikey)
+                self.tgt_time = time.time()
+            return self.tgt
+
     def get_st(self):
         """get st (service ticket) which is mandatory for each search request"""
         if self.tgt is None:
             raise SystemError("authentication is not established")
+        tgt = self.tgt
+        if time.time() - self.tgt_time > tgt_lifetime:
+            tgt = self.renew_tgt(tgt)
         params = {'service': uri_service}
         h = {
             "Content-type": "application/x-www-form-urlencoded",
             "Accept": "text/plain",
             "User-Agent": "python"}
-        r = requests.post(self.tgt, data=params, headers=h)
+        r = self.session.post(tgt, data=params, headers=h)
+        if r.status_code != 200:
+            # tgt expired or revoked before its lifetime
+            tgt = self.renew_tgt(tgt)
+            r = self.session.post(tgt, data=params, headers=h)
         return r.text
 
+    def auth_params(self):
+        """authentication parameters of a request"""
+        if self.auth == 'apikey':
+            return {'apiKey': apikey}
+        return {'ticket': self.get_st()}
+
     def get_cuis(self, term, sts=None):
-        ticket = self.get_st()
         q = {
-            'ticket': ticket,
             'sabs': 'NCI',
             'string': term,
             'pageNumer': 1,
             'pageSize': 5
         }
-        r = requests.get(endpoint['search'], params=q)
+        q.update(self.auth_params())
+        r = self.session.get(endpoint['search'], params=q)
         r.encoding = 'utf-8'
         items = json.loads(r.text)
         # print(json.dumps(items, indent=4))
@@ -71,13 +134,12 @@ class Client(object):
         return jsonData
 
     def get_atoms(self, cui):
-        ticket = self.get_st()
         q = {
-            'ticket': ticket,
             'sabs': 'NCI',
         }
-        r = requests.get("{}/CUI/{}/atoms?language=ENG"
-                         "".format(endpoint['content'], cui), params=q)
+        q.update(self.auth_params())
+        r = self.session.get("{}/CUI/{}/atoms?language=ENG"
+                             "".format(endpoint['content'], cui), params=q)
         r.encoding = 'utf-8'
         if r.status_code != 200:
             return None
@@ -85,3 +147,26 @@ class Client(object):
         # print(json.dumps(items, indent=4))
         jsonData = items['result']
         return jsonData
+
+    def get_concepts(self, terms):
+        """search many terms and get the atoms of their first cuis, with
+        pool_size requests in flight
+
+        :param terms: list of terms
+        :return: dict of term -> (search result, atoms of the first cui), or
+            None for a failed lookup; atoms are None when nothing is found
+        """
+        def resolve(term):
+            try:
+                cuis = self.get_cuis(term)
+                results = (cuis or {}).get('results') or []
+                if len(results) == 0 or results[0]['ui'] == 'NONE':
+                    return cuis, None
+                return cuis, self.get_atoms(results[0]['ui'])
+            except (requests.exceptions.RequestException, ValueError,
+                    KeyError):
+                return None
+
+        terms = list(dict.fromkeys(terms))
+        with ThreadPoolExecutor(self.pool_size) as executor:
+            return dict(zip(terms, executor.map(resolve, terms)))